@@ -0,0 +1,189 @@
+# ----------------------------------------------------------------------------#
+# Imports
+# ----------------------------------------------------------------------------#
+
+import gzip
+from datetime import datetime
+from flask import Blueprint, current_app, jsonify, request, abort
+from werkzeug.exceptions import HTTPException
+from forms import FilterForm
+from models import Venue, Artist
+from queries import (
+    detail_shows,
+    entity_fields,
+    entity_page,
+    shows_page,
+    decode_cursor
+)
+from replicas import read_replica
+
+try:
+    # optional dependency, responses fall back to gzip without it
+    import brotli
+except ImportError:
+    brotli = None
+
+
+api = Blueprint('api', __name__, url_prefix='/api/v1')
+
+# fields returned when the request has no fields= parameter
+LIST_FIELDS = ('id', 'name', 'city', 'state')
+DETAIL_FIELDS = ('id', 'name', 'city', 'state', 'phone', 'genres',
+                 'image_link', 'facebook_link', 'website',
+                 'seeking_description')
+SHOW_FIELDS = ('id', 'start_time', 'end_time', 'venue_id', 'venue_name',
+               'artist_id', 'artist_name', 'artist_image_link')
+# fields of the detail endpoints answered by detail_shows()
+SHOWS_FIELDS = ('past_shows', 'upcoming_shows', 'past_shows_count',
+                'upcoming_shows_count')
+
+
+# ----------------------------------------------------------------------------#
+# Helpers.
+# ----------------------------------------------------------------------------#
+
+
+def requested_fields(default):
+    # ?fields=id,name,... in the order given, without duplicates
+    fields = request.args.get('fields')
+    if not fields:
+        return default
+    return tuple(dict.fromkeys(
+        field.strip() for field in fields.split(',') if field.strip()))
+
+
+def page_size():
+    limit = request.args.get(
+        'limit', current_app.config['API_PAGE_SIZE'], type=int)
+    return max(1, min(limit, current_app.config['API_MAX_PAGE_SIZE']))
+
+
+def serialize(value):
+    # datetimes as ISO 8601 instead of the HTTP date format of jsonify
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, dict):
+        return {key: serialize(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [serialize(item) for item in value]
+    return value
+
+
+def page_response(page, next_cursor):
+    return jsonify({
+        'data': serialize(page['data']),
+        'next': next_cursor
+    })
+
+
+# ----------------------------------------------------------------------------#
+# Endpoints.
+# ----------------------------------------------------------------------------#
+
+
+def list_entities(model):
+    # ?genre= (repeatable) and ?state= filter like on the HTML listings
+    after = request.args.get('after')
+    filters = FilterForm(request.args)
+    if not filters.validate():
+        abort(400, str(filters.errors))
+    try:
+        page = entity_page(model, requested_fields(LIST_FIELDS),
+                           int(after) if after else None, page_size(),
+                           filters.genre.data, filters.state.data)
+    except ValueError as error:
+        abort(400, str(error))
+    return page_response(page, page['next'] and str(page['next']))
+
+
+def show_entity(model, entity_id):
+    fields = requested_fields(DETAIL_FIELDS + SHOWS_FIELDS)
+    columns = [field for field in fields if field not in SHOWS_FIELDS]
+    try:
+        data = entity_fields(model, entity_id, columns)
+    except ValueError as error:
+        abort(400, str(error))
+    if data is None:
+        abort(404)
+    if set(fields) & set(SHOWS_FIELDS):
+        shows = detail_shows(
+            model, entity_id, current_app.config['DETAIL_SHOWS_LIMIT'],
+            lists=[field[:-len('_shows')] for field in fields
+                   if field in ('past_shows', 'upcoming_shows')])
+        data.update((field, shows[field]) for field in fields
+                    if field in SHOWS_FIELDS)
+    return jsonify(serialize(data))
+
+
+@api.route('/venues')
+@read_replica
+def venues():
+    return list_entities(Venue)
+
+
+@api.route('/venues/<int:venue_id>')
+@read_replica
+def venue(venue_id):
+    return show_entity(Venue, venue_id)
+
+
+@api.route('/artists')
+@read_replica
+def artists():
+    return list_entities(Artist)
+
+
+@api.route('/artists/<int:artist_id>')
+@read_replica
+def artist(artist_id):
+    return show_entity(Artist, artist_id)
+
+
+@api.route('/shows')
+@read_replica
+def shows():
+    after = request.args.get('after')
+    try:
+        page = shows_page(decode_cursor(after) if after else None,
+                          page_size(), requested_fields(SHOW_FIELDS))
+    except ValueError as error:
+        abort(400, str(error))
+    return page_response(page, page['next'])
+
+
+# by code too, the HTML handlers of the app would win otherwise
+@api.errorhandler(400)
+@api.errorhandler(404)
+@api.errorhandler(HTTPException)
+def http_error(error):
+    return jsonify({'error': error.name, 'message': error.description}), \
+        error.code
+
+
+# ----------------------------------------------------------------------------#
+# Compression.
+# ----------------------------------------------------------------------------#
+
+
+@api.after_request
+def compress(response):
+    # brotli or gzip for the encodings the client accepts, small bodies
+    # are not worth the CPU
+    response.vary.add('Accept-Encoding')
+    if response.direct_passthrough or 'Content-Encoding' in response.headers \
+            or response.content_length is None or response.content_length < \
+            current_app.config['API_COMPRESS_MIN_SIZE']:
+        return response
+    encodings = ['br', 'gzip'] if brotli is not None else ['gzip']
+    encoding = request.accept_encodings.best_match(encodings)
+    if encoding == 'br':
+        response.set_data(brotli.compress(
+            response.get_data(), quality=current_app.config[
+                'API_BROTLI_QUALITY']))
+    elif encoding == 'gzip':
+        response.set_data(gzip.compress(
+            response.get_data(), current_app.config['API_GZIP_LEVEL']))
+    else:
+        return response
+    response.headers['Content-Encoding'] = encoding
+    return response
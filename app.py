@@ -3,15 +3,20 @@
 # ----------------------------------------------------------------------------#
 
 from email.policy import default
+import calendar
+from datetime import datetime, timedelta
+import hmac
+import io
 import json
 import logging
-import dateutil.parser
-import babel
 from flask import (
+    Blueprint,
     Flask,
+    current_app,
     render_template,
     request,
     Response,
+    stream_with_context,
     flash,
     redirect,
     url_for,
@@ -19,121 +24,132 @@ from flask import (
     abort
 )
 from flask_moment import Moment
-from flask_sqlalchemy import SQLAlchemy
 import logging
 from logging import Formatter, FileHandler
 from flask_wtf import Form
 from pytz_deprecation_shim import timezone
 from forms import *
 from flask_migrate import Migrate
-import sys
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import load_only
 from models import (
-    app,
     db,
     Venue,
     Artist,
-    Show
+    Show,
+    show_constraint_error
+)
+from cache import (
+    cache,
+    cached_page,
+    cached_stream,
+    conditional_page,
+    Snapshot
+)
+from calendars import calendar_rows
+from metrics import init_metrics, exposition
+from filters import format_datetime
+from replicas import read_replica
+from importer import KINDS, format_for, import_stream, import_command
+from exporter import FORMATS, export_rows, export_command
+from rollover import init_rollover, rollover_command
+from api import api
+from queries import (
+    entity_filters,
+    home_data,
+    venue_areas,
+    area_venues,
+    search,
+    detail_shows,
+    detail_version,
+    listing_version,
+    shows_page,
+    calendar_shows,
+    decode_cursor
 )
 
 # ----------------------------------------------------------------------------#
 # App Config.
 # ----------------------------------------------------------------------------#
 
-app = Flask(__name__)
-moment = Moment(app)
-app.config.from_object('config')
-db = SQLAlchemy(app)
-
-migrate = Migrate(app, db)
-
-
-# ----------------------------------------------------------------------------#
-# Filters.
-# ----------------------------------------------------------------------------#
-
-
-def format_datetime(value, format='medium'):
-    date = dateutil.parser.parse(value)
-    if format == 'full':
-        format = "EEEE MMMM, d, y 'at' h:mma"
-    elif format == 'medium':
-        format = "EE MM, dd, y h:mma"
-    return babel.dates.format_datetime(date, format, locale='en')
-
-
-app.jinja_env.filters['datetime'] = format_datetime
+moment = Moment()
+migrate = Migrate()
+# the pages, registered on the app by create_app()
+main = Blueprint('main', __name__)
+
+
+def create_app(config='config'):
+    # an application with its own engine the models and views share, its
+    # pool is sized by SQLALCHEMY_ENGINE_OPTIONS in config.py
+    app = Flask(__name__)
+    app.config.from_object(config)
+    db.init_app(app)
+    migrate.init_app(app, db)
+    moment.init_app(app)
+    cache.init_app(app)
+    init_metrics(app)
+    init_rollover(app)
+    app.extensions['home_snapshot'] = Snapshot(
+        'home', ['venues', 'artists'], home_data,
+        app.config['HOME_SNAPSHOT_MAX_AGE'])
+    app.jinja_env.filters['datetime'] = format_datetime
+    app.cli.add_command(import_command)
+    app.cli.add_command(export_command)
+    app.cli.add_command(rollover_command)
+    app.register_blueprint(main)
+    app.register_blueprint(api)
+    if not app.debug:
+        app.logger.setLevel(logging.INFO)
+        # flask's own handler logs to stderr, to also log to LOG_FILE
+        if app.config['LOG_FILE']:
+            file_handler = FileHandler(app.config['LOG_FILE'])
+            file_handler.setFormatter(
+                Formatter(
+                    '%(asctime)s %(levelname)s: %(message)s\
+                     [in %(pathname)s:%(lineno)d]')
+            )
+            file_handler.setLevel(logging.INFO)
+            app.logger.addHandler(file_handler)
+        app.logger.info('errors')
+    return app
 
 # ----------------------------------------------------------------------------#
 # Controllers.
 # ----------------------------------------------------------------------------#
 
 
-@app.route('/')
+@main.route('/')
+@read_replica
 def index():
-    recent_artists = Artist.query.order_by(Artist.id.desc()).limit(10).all()
-    venues = Venue.query.order_by(Venue.id.desc()).limit(10).all()
-    # to get only requeried data
-    unique_venues = Venue.query.distinct(Venue.city, Venue.state).all()
-    data = []
-    # to store current time
-    for unique_venue in unique_venues:
-        # to store venues in each city
-        venue_data = []
-        for venue in venues:
-            if unique_venue.city == venue.city:
-                venue_data.append({
-                    'id': venue.id,
-                    'name': venue.name
-                })
-        data.append({
-            'city': unique_venue.city,
-            'state': unique_venue.state,
-            'venues': venue_data
+    data = current_app.extensions['home_snapshot'].get()
+    if current_app.logger.isEnabledFor(logging.DEBUG):
+        current_app.logger.debug('home page', extra={
+            'recent_artists': len(data['recent_artists']),
+            'areas': len(data['areas'])
         })
-    print(data)
-    return render_template('pages/home.html', recent_artists=recent_artists,
-                           areas=data)
+    return render_template('pages/home.html', **data)
 
 
 #  Venues
 #  ----------------------------------------------------------------
 
-@app.route('/venues')
+@main.route('/venues')
+@read_replica
+@conditional_page(lambda: listing_version(Venue))
+@cached_page('venues', 'shows')
 def venues():
-    # num_upcoming_shows should be aggregated based on number
-    # of upcoming shows per venue.
+    # num_upcoming_shows is read from the counter column
+    # in the same query that lists the venues.
     data = []
     error = False
+    filters = listing_filters(request.args)
     try:
         error = False
-        # get all venues form the database
-        venues = Venue.query.all()
-        # to get only requeried data
-        unique_venues = Venue.query.distinct(Venue.city, Venue.state).all()
-        # to store the current time
-        current_time = datetime.now()
-        # to store current time
-        for unique_venue in unique_venues:
-            # to store venues in each city
-            venue_data = []
-            for venue in venues:
-                if unique_venue.city == venue.city:
-                    venue_data.append({
-                        'id': venue.id,
-                        'name': venue.name,
-                        'num_upcoming_shows': Show.query.filter(db.and_(
-                            Show.start_time > current_time, Show.venue_id
-                            == venue.id)
-                        ).count()
-                    })
-            data.append({
-                'city': unique_venue.city,
-                'state': unique_venue.state,
-                'venues': venue_data
-            })
+        # to get the venues grouped by city and state
+        data = venue_areas(filters.genre.data, filters.state.data)
     except Exception:
         error = True
-        print(sys.exc_info())
+        current_app.logger.exception('%s failed', request.endpoint)
         abort(500)
     finally:
         # to check if there was any errors
@@ -141,72 +157,66 @@ def venues():
             flash(
                 u'Due to an error from our end. We are unable to\
                 show you the venues page', 'alert-danger')
-            return render_template('pages/venues.html', areas=data)
+            return render_template('pages/venues.html', areas=data,
+                                   filters=filters)
         else:
-            return render_template('pages/venues.html', areas=data)
+            return render_template('pages/venues.html', areas=data,
+                                   filters=filters)
+
 
+@main.route('/venues/area/<state>/<city>')
+@read_replica
+@cached_page('venues', 'shows')
+def show_area(state, city):
+    # the venues of one city, the counts come from the area table
+    area = area_venues(state, city)
+    if area is None:
+        abort(404)
+    return render_template('pages/area.html', area=area)
 
-@ app.route('/venues/search', methods=['POST'])
+
+@main.route('/venues/search', methods=['POST'])
+@read_replica
 def search_venues():
     # search. Ensure it is case-insensitive.
     # seach for Hop should return "The Musical Hop".
     # search for "Music" should return "The Musical Hop"
     # and "Park Square Live Music & Coffee"
-    data = []
     search_term = request.form['search_term']
-    # to query the db base on the search value from the form
-    results = Venue.query.with_entities(Venue.id, Venue.name).filter(
-        Venue.name.ilike("%" + search_term + "%"))
-    venues = results.all()
-    for venue in venues:
-        data.append({
-            'id': venue.id,
-            'name': venue.name,
-            'num_upcoming_shows': Show.query.filter(db.and_(
-                Show.start_time > datetime.now(), Show.venue_id
-                == venue.id
-            )).count()
-        })
-    response = {
-        "count": results.count(),
-        "data": data
-    }
+    page = request.form.get('page', 1, type=int)
+    filters = listing_filters(request.form)
+    # to query the db base on the search value from the form,
+    # one page of hits at a time
+    response = search(Venue, search_term, page,
+                      current_app.config['SEARCH_RESULTS_PER_PAGE'],
+                      filters.genre.data, filters.state.data)
     return render_template('pages/search_venues.html',
                            results=response, search_term=request.form.
-                           get('search_term', ''))
+                           get('search_term', ''), filters=filters)
 
 
-@app.route('/venues/<int:venue_id>')
+@main.route('/venues/<int:venue_id>')
+@read_replica
+@conditional_page(lambda venue_id: detail_version(Venue, venue_id))
+@cached_page('venue:{venue_id}', 'artists', 'rollover')
 def show_venue(venue_id):
     # to get specific venue
     venue = Venue.query.get(venue_id)
-    # to get current time
-    current_date = datetime.now()
-    # to get shows for specific venue
-    venue_shows = Show.query.filter(Show.venue_id == venue_id)
-    # to store past shows
-    p_shows = []
-    # to store upcoming shows
-    u_shows = []
-    # loop through all the venue shows
-    for show in venue_shows:
-        if show.start_time < current_date:
-            # appending past shows
-            p_shows.append({
-                'artist_id': show.id,
-                'artist_name': show.artist.name,
-                'artist_image_link': show.venue.image_link,
-                'start_time': format_datetime(str(show.start_time))
-            })
-        else:
-            u_shows.append({
-                'artist_id': show.id,
-                'artist_name': show.artist.name,
-                'artist_image_link': show.venue.image_link,
-                'start_time': format_datetime(str(show.start_time))
-            })
+    if venue is None:
+        abort(404)
+    # to get one slice of the past and upcoming shows of the venue
+    shows = detail_shows(Venue, venue_id,
+                         current_app.config['DETAIL_SHOWS_LIMIT'],
+                         *detail_offsets(), counts=(
+                             venue.past_shows_count,
+                             venue.upcoming_shows_count))
+    return render_template('pages/show_venue.html',
+                           venue=venue_details(venue, shows))
+
+
+def venue_details(venue, shows):
     # appending the details to the data var.
-    data = {
+    return {
         "id": venue.id,
         "name": venue.name,
         "genres": venue.genres,
@@ -219,24 +229,34 @@ def show_venue(venue_id):
         "seeking_talent": venue.seeking_talent,
         "seeking_description": venue.seeking_description,
         "image_link": venue.image_link,
-        "past_shows": p_shows,
-        "upcoming_shows": u_shows,
-        "past_shows_count": len(p_shows),
-        "upcoming_shows_count": len(u_shows),
+        **shows
     }
-    return render_template('pages/show_venue.html', venue=data)
+
+
+def listing_filters(formdata):
+    # to read the genre and state filters, unknown values are a bad request
+    filters = FilterForm(formdata)
+    if not filters.validate():
+        abort(400)
+    return filters
+
+
+def detail_offsets():
+    # to get the "load more" offsets of the past and upcoming shows
+    return (max(request.args.get('past_offset', 0, type=int), 0),
+            max(request.args.get('upcoming_offset', 0, type=int), 0))
 
 #  Create Venue
 #  ----------------------------------------------------------------
 
 
-@app.route('/venues/create', methods=['GET'])
+@main.route('/venues/create', methods=['GET'])
 def create_venue_form():
     form = VenueForm()
     return render_template('forms/new_venue.html', form=form)
 
 
-@app.route('/venues/create', methods=['POST'])
+@main.route('/venues/create', methods=['POST'])
 def create_venue_submission():
     error = False
     form = VenueForm()
@@ -263,7 +283,7 @@ def create_venue_submission():
         except Exception:
             error: True
             db.session.rollback()
-            print(sys.exc_info())
+            current_app.logger.exception('%s failed', request.endpoint)
         finally:
             db.session.close()
             if error:
@@ -290,7 +310,7 @@ def create_venue_submission():
         return render_template('forms/new_venue.html', form=form)
 
 
-@app.route('/venues/<venue_id>', methods=['DELETE'])
+@main.route('/venues/<venue_id>', methods=['DELETE'])
 def delete_venue(venue_id):
     # SQLAlchemy ORM to delete a record. Handle cases where the
     # session commit could fail.
@@ -303,7 +323,7 @@ def delete_venue(venue_id):
     except Exception:
         error = True
         db.session.rollback()
-        print(sys.exc_info())
+        current_app.logger.exception('%s failed', request.endpoint)
     finally:
         db.session.close()
         if not error:
@@ -319,90 +339,73 @@ def delete_venue(venue_id):
 #  ----------------------------------------------------------------
 
 
-@app.route('/artists')
+@main.route('/artists')
+@read_replica
+@conditional_page(lambda: listing_version(Artist))
+@cached_page('artists')
 def artists():
     # the database
     # to get all artist from the database
     data = []
-    artists = Artist.query.all()
+    filters = listing_filters(request.args)
+    artists = Artist.query.options(load_only(Artist.id, Artist.name)).filter(
+        *entity_filters(Artist, filters.genre.data, filters.state.data)).all()
     for artist in artists:
         data.append({
             "id": artist.id,
             "name": artist.name
         })
-    return render_template('pages/artists.html', artists=data)
+    return render_template('pages/artists.html', artists=data,
+                           filters=filters)
 
 
-@app.route('/artists/search', methods=['POST'])
+@main.route('/artists/search', methods=['POST'])
+@read_replica
 def search_artists():
     # Ensure it is case-insensitive.
     # seach for "A" should return "Guns N Petals", "Matt Quevado",
     # and "The Wild Sax Band".
     # search for "band" should return "The Wild Sax Band".
     # to get the search from the search form
-    data = []
     search_term = request.form['search_term']
-    # to query the db base on the search value from the form
-    results = Artist.query.with_entities(Artist.id, Artist.name).filter(
-        Artist.name.ilike("%" + search_term + "%"))
-    artists = results.all()
-    for artist in artists:
-        data.append({
-            'id': artist.id,
-            'name': artist.name,
-            'num_upcoming_shows': Show.query.filter(db.and_(
-                Show.start_time > datetime.now(), Show.artist_id
-                == artist.id
-            )).count()
-        })
-    response = {
-        "count": results.count(),
-        "data": data
-    }
+    page = request.form.get('page', 1, type=int)
+    filters = listing_filters(request.form)
+    # to query the db base on the search value from the form,
+    # one page of hits at a time
+    response = search(Artist, search_term, page,
+                      current_app.config['SEARCH_RESULTS_PER_PAGE'],
+                      filters.genre.data, filters.state.data)
     return render_template('pages/search_artists.html',
                            results=response, search_term=request.form.
-                           get('search_term', ''))
+                           get('search_term', ''), filters=filters)
 
 
-@app.route('/artists/<int:artist_id>')
+@main.route('/artists/<int:artist_id>')
+@read_replica
+@conditional_page(lambda artist_id: detail_version(Artist, artist_id))
+@cached_page('artist:{artist_id}', 'venues', 'rollover')
 def show_artist(artist_id):
     # shows the artist page with the given artist_id
     # table, using artist_id
 
     # to get specific artist for the datase
     artist = Artist.query.get(artist_id)
+    if artist is None:
+        abort(404)
 
-    # get the current time
-    current_date = datetime.now()
+    # to get one slice of the past and upcoming shows of the artist
+    shows = detail_shows(Artist, artist_id,
+                         current_app.config['DETAIL_SHOWS_LIMIT'],
+                         *detail_offsets(), counts=(
+                             artist.past_shows_count,
+                             artist.upcoming_shows_count))
 
-    # to get shows for specific artist
-    artist_shows = Show.query.filter(Show.artist_id == artist_id)
+    return render_template('pages/show_artist.html',
+                           artist=artist_details(artist, shows))
 
-    # to store past shows
-    p_shows = []
 
-    # to store upcoming shows
-    u_shows = []
-
-    # loop through all the artist shows
-    for show in artist_shows:
-        if show.start_time < current_date:
-            # appending past shows
-            p_shows.append({
-                'venue_id': show.id,
-                'venue_name': show.venue.name,
-                'venue_image_link': show.venue.image_link,
-                'start_time': format_datetime(str(show.start_time))
-            })
-        else:
-            u_shows.append({
-                'venue_id': show.id,
-                'venue_name': show.venue.name,
-                'venue_image_link': show.venue.image_link,
-                'start_time': format_datetime(str(show.start_time))
-            })
-
-    data = {
+def artist_details(artist, shows):
+    return {
         "id": artist.id,
         "name": artist.name,
         "genres": artist.genres,
@@ -414,73 +417,58 @@ def show_artist(artist_id):
         "seeking_venue": artist.seeking_venue,
         "seeking_description": artist.seeking_description,
         "image_link": artist.image_link,
-        "past_shows": p_shows,
-        "upcoming_shows": u_shows,
-        "past_shows_count": len(p_shows),
-        "upcoming_shows_count": len(u_shows),
+        **shows
     }
 
-    return render_template('pages/show_artist.html', artist=data)
-
 #  Update
 #  ----------------------------------------------------------------
 
 
-@app.route('/artists/<int:artist_id>/edit', methods=['GET'])
+@main.route('/artists/<int:artist_id>/edit', methods=['GET'])
 def edit_artist(artist_id):
-    form = ArtistForm()
     artist = Artist.query.get(artist_id)
+    if artist is None:
+        abort(404)
+    # to pre-fill the form, genres included, from the loaded artist
+    form = ArtistForm(obj=artist, website_link=artist.website)
     return render_template('forms/edit_artist.html',
                            form=form, artist=artist)
 
+
+def genres_response(model, entity_id, key):
+    # genres of a venue or artist, cached until it changes and answered
+    # with a 304 when the client already has them
+    tag = '%s:%d' % (model.__tablename__, entity_id)
+    genres = cache.cached('genres:' + tag, [tag], lambda: db.session.query(
+        model.genres).filter(model.id == entity_id).scalar())
+    if genres is None:
+        abort(404)
+    response = jsonify({key: genres})
+    response.add_etag()
+    response.cache_control.no_cache = True
+    return response.make_conditional(request)
+
 #
-# to get list of artist genres for the artist edit page
+# to get list of artist genres, the edit page renders them itself
 
 
-@app.route('/get_artist_genres/<int:artist_id>', methods=['POST'])
+@main.route('/get_artist_genres/<int:artist_id>', methods=['GET', 'POST'])
+@read_replica
 def get_artist_genres(artist_id):
-    error = False
-    data = {}
-    try:
-        error = False
-        artist_genres = Artist.query.with_entities(
-            Artist.genres).filter_by(id=artist_id).first()
-        data['artist_genres'] = artist_genres[0]
-    except Exception:
-        error = True
-        print(sys.exc_info())
-    finally:
-        if error:
-            abort(500)
-        else:
-            return jsonify(data)
+    return genres_response(Artist, artist_id, 'artist_genres')
 
 
 #
-# to get list of venue genres for the venue edit page
+# to get list of venue genres, the edit page renders them itself
 
 
-@app.route('/get_venue_genres/<int:venue_id>', methods=['POST'])
+@main.route('/get_venue_genres/<int:venue_id>', methods=['GET', 'POST'])
+@read_replica
 def get_venue_genres(venue_id):
-    error = False
-    data = {}
-    try:
-        error = False
-        venue_genres = Venue.query.with_entities(
-            Venue.genres).filter_by(id=venue_id).first()
-        data['venue_genres'] = venue_genres[0]
-        print(data)
-    except Exception:
-        error = True
-        print(sys.exc_info())
-    finally:
-        if error:
-            abort(500)
-        else:
-            return jsonify(data)
+    return genres_response(Venue, venue_id, 'venue_genres')
 
 
-@app.route('/artists/<int:artist_id>/edit', methods=['POST'])
+@main.route('/artists/<int:artist_id>/edit', methods=['POST'])
 def edit_artist_submission(artist_id):
     # artist record with ID <artist_id> using the new attributes
     error = True
@@ -497,7 +485,7 @@ def edit_artist_submission(artist_id):
         except Exception:
             error = True
             db.session.rollback()
-            print(sys.exc_info())
+            current_app.logger.exception('%s failed', request.endpoint)
         finally:
             db.session.close()
             if error:
@@ -506,13 +494,15 @@ def edit_artist_submission(artist_id):
                       form.data['name'] + ' could not be edited.\
                         ', 'alert-danger')
                 # return to the artist edit page with an error
-                return redirect(url_for('edit_artist', artist_id=artist_id))
+                return redirect(url_for('main.edit_artist',
+                                        artist_id=artist_id))
             else:
                 # # on successful db insert, flash success
                 flash(u'Artist ' + form.data['name'] +
                       ' was successfully edited!', 'alert-info')
                 # return to the artist edit page with an error
-                return redirect(url_for('show_artist', artist_id=artist_id))
+                return redirect(url_for('main.show_artist',
+                                        artist_id=artist_id))
     else:
         # return form validation error
         flash(u'An error occurred. Artist ' +
@@ -524,17 +514,20 @@ def edit_artist_submission(artist_id):
                 if index == 0:
                     flash(u'' + str(error_messages), 'alert-danger')
         # return to the artist edit page with an error
-        return redirect(url_for('edit_artist', artist_id=artist_id))
+        return redirect(url_for('main.edit_artist', artist_id=artist_id))
 
 
-@app.route('/venues/<int:venue_id>/edit', methods=['GET'])
+@main.route('/venues/<int:venue_id>/edit', methods=['GET'])
 def edit_venue(venue_id):
-    form = VenueForm()
     venue = Venue.query.get(venue_id)
+    if venue is None:
+        abort(404)
+    # to pre-fill the form, genres included, from the loaded venue
+    form = VenueForm(obj=venue, website_link=venue.website)
     return render_template('forms/edit_venue.html', form=form, venue=venue)
 
 
-@app.route('/venues/<int:venue_id>/edit', methods=['POST'])
+@main.route('/venues/<int:venue_id>/edit', methods=['POST'])
 def edit_venue_submission(venue_id):
     # venue record with ID <venue_id> using the new attributes
     error = False
@@ -551,7 +544,7 @@ def edit_venue_submission(venue_id):
         except Exception:
             error = True
             db.session.rollback()
-            print(sys.exc_info())
+            current_app.logger.exception('%s failed', request.endpoint)
         finally:
             db.session.close()
             if error:
@@ -560,12 +553,12 @@ def edit_venue_submission(venue_id):
                       form.data['name'] + ' could not be edited.',
                       'alert-danger')
                 # return to the venue edit page with an error
-                return redirect(url_for('edit_venue', venue_id=venue_id))
+                return redirect(url_for('main.edit_venue', venue_id=venue_id))
             else:
                 # # on successful db insert, flash success
                 flash(u'Venue ' + form.data['name'] +
                       ' was successfully edited!', 'alert-info')
-                return redirect(url_for('show_venue', venue_id=venue_id))
+                return redirect(url_for('main.show_venue', venue_id=venue_id))
 
     else:
         # return form validation error
@@ -578,20 +571,20 @@ def edit_venue_submission(venue_id):
                 if index == 0:
                     flash(u'' + str(error_messages), 'alert-danger')
         # return to the venue edit page with an error
-        return redirect(url_for('edit_venue', venue_id=venue_id))
-    # return redirect(url_for('show_venue', venue_id=venue_id))
+        return redirect(url_for('main.edit_venue', venue_id=venue_id))
+    # return redirect(url_for('main.show_venue', venue_id=venue_id))
 
 #  Create Artist
 #  ----------------------------------------------------------------
 
 
-@app.route('/artists/create', methods=['GET'])
+@main.route('/artists/create', methods=['GET'])
 def create_artist_form():
     form = ArtistForm()
     return render_template('forms/new_artist.html', form=form)
 
 
-@app.route('/artists/create', methods=['POST'])
+@main.route('/artists/create', methods=['POST'])
 def create_artist_submission():
     # called upon submitting the new artist listing form
     error = False
@@ -617,7 +610,7 @@ def create_artist_submission():
         except Exception:
             error = True
             db.session.rollback()
-            print(sys.exc_info())
+            current_app.logger.exception('%s failed', request.endpoint)
         finally:
             db.session.close()
             if error:
@@ -647,58 +640,145 @@ def create_artist_submission():
 #  Shows
 #  ----------------------------------------------------------------
 
-@app.route('/shows')
+@main.route('/shows')
+@read_replica
+@cached_page('shows', 'venues', 'artists')
 def shows():
-    # displays list of shows at /shows
-    # to get all shows from the datebase
-    data = []
-    shows = Show.query.all()
-    for show in shows:
-        data.append({
-            "venue_id": show.venue.id,
-            "venue_name": show.venue.name,
-            "artist_id": show.artist.id,
-            "artist_name": show.artist.name,
-            "artist_image_link": show.artist.image_link,
-            "start_time": str(show.start_time)
-        })
-    return render_template('pages/shows.html', shows=data)
+    # displays list of shows at /shows, one page at a time, filtered by
+    # ?from=&to=&city=&state=&genre=
+    filters = show_window_filters()
+    data = shows_listing(filters)
+    return render_template('pages/shows.html', shows=data['data'],
+                           next_cursor=data['next'], filters=filters,
+                           filter_args=filter_args())
+
+
+@main.route('/shows.json')
+@read_replica
+def shows_json():
+    # same pages as /shows for the front-end
+    data = shows_listing(show_window_filters())
+    for show in data['data']:
+        show['start_time'] = show['start_time'].isoformat()
+    return jsonify(data)
+
+
+def show_window_filters():
+    # to read the time window and location filters of the shows listing
+    filters = ShowWindowForm(request.args)
+    if not filters.validate():
+        abort(400)
+    return filters
 
 
-@app.route('/shows/create')
+def filter_args():
+    # the query string of the listing without its cursor, for the pager
+    args = request.args.to_dict(flat=False)
+    args.pop('after', None)
+    return args
+
+
+def shows_listing(filters):
+    # to get the page of shows after the ?after= cursor
+    return shows_page(listing_cursor(), current_app.config['SHOWS_PER_PAGE'],
+                      **show_filters(filters))
+
+
+def listing_cursor():
+    after = request.args.get('after')
+    try:
+        return decode_cursor(after) if after else None
+    except ValueError:
+        abort(400)
+
+
+def show_filters(filters):
+    # the filter_shows() arguments of a ShowWindowForm
+    return {
+        'start': filters.date_from.data,
+        'end': filters.date_to.data,
+        'city': filters.city.data,
+        'state': filters.state.data,
+        'genres': filters.genre.data
+    }
+
+
+@main.route('/shows/calendar')
+@read_replica
+@cached_page('shows', 'venues', 'artists')
+def shows_calendar():
+    # one month of shows, ?month=YYYY-MM, with the city, state and genre
+    # filters of the listing
+    filters = ShowFilterForm(request.args)
+    if not filters.validate():
+        abort(400)
+    args = filter_args()
+    args.pop('month', None)
+    if not request.args.get('month'):
+        # to this month, named in the url so the cached page is keyed on it
+        return redirect(url_for('main.shows_calendar', month=datetime.now(
+        ).strftime('%Y-%m'), **args))
+    try:
+        month = datetime.strptime(request.args['month'], '%Y-%m')
+    except ValueError:
+        abort(400)
+    weeks = calendar.Calendar().monthdatescalendar(month.year, month.month)
+    days = calendar_shows(
+        weeks[0][0], weeks[-1][-1],
+        current_app.config['CALENDAR_SHOWS_PER_DAY'],
+        city=filters.city.data, state=filters.state.data,
+        genres=filters.genre.data)
+    previous_month = month.replace(day=1) - timedelta(days=1)
+    next_month = month.replace(day=28) + timedelta(days=4)
+    return render_template('pages/calendar.html', weeks=weeks, days=days,
+                           month=month, previous_month=previous_month,
+                           next_month=next_month, one_day=timedelta(days=1),
+                           filters=filters, filter_args=args)
+
+
+@main.route('/shows/create')
 def create_shows():
     # renders form. do not touch.
     form = ShowForm()
     return render_template('forms/new_show.html', form=form)
 
 
-@app.route('/shows/create', methods=['POST'])
+@main.route('/shows/create', methods=['POST'])
 def create_show_submission():
     # called to create new shows in the db,
     # upon submitting new show listing form
     # record in the db, instead
     error = False
+    message = u'An error occurred. Show could not be listed.'
     form = ShowForm()
     # form validation
     if form.validate_on_submit():
         try:
             error = False
-            # new record to be inserted
+            # new record to be inserted, the constraints reject unknown
+            # venues and artists and overlapping bookings
             new_record = Show(artist_id=form.data['artist_id'],
                               venue_id=form.data['venue_id'],
-                              start_time=form.data['start_time'])
+                              start_time=form.data['start_time'],
+                              duration=timedelta(
+                                  minutes=form.data['duration']))
             db.session.add(new_record)
             db.session.commit()
+        except IntegrityError as integrity_error:
+            error = True
+            db.session.rollback()
+            conflict = show_constraint_error(integrity_error)
+            if conflict:
+                message = conflict[1]
         except Exception:
             error = True
             db.session.rollback()
-            print(sys.exc_info())
+            current_app.logger.exception('%s failed', request.endpoint)
         finally:
             db.session.close()
             if error:
-                flash(u'An error occurred. Show could not be listed.',
-                      'alert-danger')
-                return redirect(url_for('create_shows'))
+                flash(message, 'alert-danger')
+                return redirect(url_for('main.create_shows'))
             else:
                 # on successful db insert, flash success
                 flash(u'Show was successfully listed!', 'alert-info')
@@ -707,37 +787,141 @@ def create_show_submission():
         # return user to the create page with error message
         # e.g., flash('An error occurred. Show could not be listed.')
         # see: http://flask.pocoo.org/docs/1.0/patterns/flashing/
-        flash(u'An error occurred. Show could not be listed.', 'alert-danger')
-        return redirect(url_for('create_shows'))
+        flash(message, 'alert-danger')
+        return redirect(url_for('main.create_shows'))
+
+
+#  iCalendar feeds
+#  ----------------------------------------------------------------
+
+@main.route('/venues/<int:venue_id>/shows.ics')
+@read_replica
+@conditional_page(lambda venue_id: detail_version(Venue, venue_id))
+def venue_calendar(venue_id):
+    return calendar_feed(Venue, venue_id)
+
+
+@main.route('/artists/<int:artist_id>/shows.ics')
+@read_replica
+@conditional_page(lambda artist_id: detail_version(Artist, artist_id))
+def artist_calendar(artist_id):
+    return calendar_feed(Artist, artist_id)
+
+
+def calendar_feed(model, entity_id):
+    # the shows of a venue or an artist as an iCalendar feed, streamed and
+    # kept in the cache until one of its shows is written
+    name = db.session.query(model.name).filter(
+        model.id == entity_id).scalar()
+    if name is None:
+        abort(404)
+    tag = '%s:%d' % (model.__tablename__, entity_id)
+    # the feed links the shows with absolute urls of the requested host
+    rows = cached_stream(
+        'ics:%s:%s' % (request.host_url, tag), [tag], lambda: calendar_rows(
+            model, entity_id, name, request.host_url,
+            db.session.get_bind()),
+        current_app.config['ICS_CACHE_TTL'],
+        current_app.config['ICS_CACHE_MAX_SIZE'])
+    response = Response(stream_with_context(rows),
+                        mimetype='text/calendar')
+    response.headers['Content-Disposition'] = \
+        'inline; filename=%s-%d.ics' % (model.__tablename__, entity_id)
+    return response
+
+
+#  Import
+#  ----------------------------------------------------------------
+
+
+@main.route('/import/<kind>', methods=['POST'])
+def import_data(kind):
+    # bulk import of venues, artists or shows from a CSV (with a header
+    # row) or JSON lines body, or from an uploaded 'file'. The body is
+    # read as a stream and the report lists the errors per line. Only
+    # served with IMPORT_TOKEN set, to clients sending it as a bearer
+    # token, which a cross-site form can not do
+    token = current_app.config['IMPORT_TOKEN']
+    if not token or kind not in KINDS:
+        abort(404)
+    if not hmac.compare_digest(
+            request.headers.get('Authorization', '').encode(),
+            ('Bearer ' + token).encode()):
+        abort(403)
+    upload = request.files.get('file')
+    if upload is not None:
+        stream = upload.stream
+        format = format_for(upload.filename)
+    else:
+        stream = request.stream
+        format = 'jsonl' if request.mimetype in (
+            'application/x-ndjson', 'application/jsonl') else 'csv'
+    format = request.args.get('format', format)
+    try:
+        report = import_stream(kind, io.TextIOWrapper(
+            stream, encoding='utf-8', newline=''), format)
+    except ValueError:
+        abort(400)
+    return jsonify(report)
+
+
+#  Export
+#  ----------------------------------------------------------------
+
+
+@main.route('/export/<kind>')
+@read_replica
+def export_data(kind):
+    # the whole table as CSV or NDJSON, streamed while it is read
+    format = request.args.get('format', 'csv')
+    if kind not in KINDS:
+        abort(404)
+    if format not in FORMATS:
+        abort(400)
+    rows = export_rows(kind, format, db.session.get_bind())
+    return Response(stream_with_context(rows), mimetype=FORMATS[format],
+                    headers={'Content-Disposition':
+                             'attachment; filename=%s.%s' % (kind, format)})
+
+
+#  Cache
+#  ----------------------------------------------------------------
+
+
+@main.route('/cache/stats')
+def cache_stats():
+    # hit/miss counters of the page cache
+    return jsonify(cache.stats())
+
+
+#  Metrics
+#  ----------------------------------------------------------------
+
+
+@main.route('/metrics')
+def metrics():
+    # request, statement and template timings in the Prometheus format
+    return Response(exposition(), mimetype='text/plain; version=0.0.4')
 
 
-@app.errorhandler(404)
+@main.app_errorhandler(404)
 def not_found_error(error):
     return render_template('errors/404.html'), 404
 
 
-@app.errorhandler(500)
+@main.app_errorhandler(500)
 def server_error(error):
     return render_template('errors/500.html'), 500
 
 
-if not app.debug:
-    file_handler = FileHandler('error.log')
-    file_handler.setFormatter(
-        Formatter(
-            '%(asctime)s %(levelname)s: %(message)s\
-             [in %(pathname)s:%(lineno)d]')
-    )
-    app.logger.setLevel(logging.INFO)
-    file_handler.setLevel(logging.INFO)
-    app.logger.addHandler(file_handler)
-    app.logger.info('errors')
+app = create_app()
 
 # ----------------------------------------------------------------------------#
 # Launch.
 # ----------------------------------------------------------------------------#
 
-# Default port:
+# Default port, development server only. Production runs wsgi.py under
+# gunicorn (gunicorn.conf.py):
 if __name__ == '__main__':
     app.run()
 
@@ -0,0 +1,272 @@
+# ----------------------------------------------------------------------------#
+# Async serving mode: an ASGI application for `uvicorn asgi:application`.
+# The venue, artist and shows pages run as coroutines on an asyncpg engine
+# and the independent queries of a page run at the same time, each on a
+# connection of its own. Every other request goes to the Flask app in a
+# thread pool, as under a threaded WSGI server. Needs the optional a2wsgi,
+# asyncpg and uvicorn packages (requirements-async.txt), the WSGI mode
+# (app.py) needs none of them.
+# ----------------------------------------------------------------------------#
+
+import asyncio
+import io
+import random
+from a2wsgi import WSGIMiddleware
+from a2wsgi.wsgi import build_environ
+from flask import (
+    abort,
+    g,
+    make_response,
+    render_template
+)
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import create_async_engine
+from werkzeug.exceptions import HTTPException
+from app import (
+    app,
+    venue_details,
+    artist_details,
+    detail_offsets,
+    show_window_filters,
+    show_filters,
+    listing_cursor,
+    filter_args
+)
+from cache import (
+    cached_lookup,
+    cache_page,
+    not_modified_response,
+    page_validators,
+    renders_flashes,
+    revalidated
+)
+from models import db, Venue, Artist
+from queries import (
+    detail_version_query,
+    version_state,
+    detail_show_queries,
+    detail_shows_data,
+    shows_page_query,
+    shows_page_data
+)
+from replicas import reads_from_replica, replicas
+
+
+# ----------------------------------------------------------------------------#
+# Engines.
+# ----------------------------------------------------------------------------#
+
+
+# one engine per database and worker process, created in the event loop
+# of the worker on first use
+engines = {}
+
+
+def async_engine():
+    # the primary, or one replica per request for the reads of the page,
+    # by the same rules as the RoutingSession of the WSGI mode
+    if 'async_engine' not in g:
+        name = None
+        if reads_from_replica(app):
+            name = random.choice(replicas(app)['binds'])
+        if name not in engines:
+            uri = app.config['SQLALCHEMY_BINDS'][name] if name else \
+                app.config['SQLALCHEMY_DATABASE_URI']
+            engines[name] = create_async_engine(
+                make_url(uri).set(
+                    drivername=app.config['ASYNC_DATABASE_DRIVER']),
+                **app.config['ASYNC_ENGINE_OPTIONS'])
+        g.async_engine = engines[name]
+    return g.async_engine
+
+
+async def fetch(query):
+    # the rows of a query built on db.session (or a select), read on a
+    # connection of its own so the queries of a page can be gathered
+    statement = getattr(query, 'statement', query)
+    async with async_engine().connect() as connection:
+        return (await connection.execute(statement)).all()
+
+
+async def fetch_first(query):
+    rows = await fetch(query)
+    return rows[0] if rows else None
+
+
+# ----------------------------------------------------------------------------#
+# Pages.
+# ----------------------------------------------------------------------------#
+
+
+async def conditional(validate, build):
+    # cache.conditional_page for a coroutine view
+    state = None if renders_flashes() else await validate()
+    if state is None:
+        return await build()
+    etag, last_modified = page_validators(*state)
+    response = not_modified_response(etag, last_modified) or \
+        make_response(await build())
+    return revalidated(response, etag, last_modified)
+
+
+async def cached(tags, build):
+    # cache.cached_page for a coroutine view. The memory backend answers
+    # without blocking, the redis one blocks the loop for its round trip
+    key, page = cached_lookup(tags)
+    if page is None:
+        page = await build()
+        cache_page(key, page)
+    return page
+
+
+async def detail_page(model, entity_id, template, details, tags):
+    # the venue or artist page: the version check, then the row and both
+    # slices of shows in one round trip instead of three
+    g.read_replica = True
+
+    async def validate():
+        return version_state(
+            await fetch_first(detail_version_query(model, entity_id)))
+
+    async def render():
+        limit = app.config['DETAIL_SHOWS_LIMIT']
+        past_offset, upcoming_offset = detail_offsets()
+        record, past, upcoming = await asyncio.gather(
+            fetch_first(db.select(model.__table__).where(
+                model.id == entity_id)),
+            *map(fetch, detail_show_queries(
+                model, entity_id, limit, past_offset, upcoming_offset)))
+        if record is None:
+            abort(404)
+        shows = detail_shows_data(
+            past, upcoming,
+            (record.past_shows_count, record.upcoming_shows_count),
+            limit, past_offset, upcoming_offset)
+        return render_template(template, **{
+            model.__tablename__: details(record, shows)})
+
+    return await conditional(validate, lambda: cached(tags, render))
+
+
+async def show_venue(venue_id):
+    return await detail_page(Venue, venue_id, 'pages/show_venue.html',
+                             venue_details, ['venue:%d' % venue_id,
+                                             'artists', 'rollover'])
+
+
+async def show_artist(artist_id):
+    return await detail_page(Artist, artist_id, 'pages/show_artist.html',
+                             artist_details, ['artist:%d' % artist_id,
+                                              'venues', 'rollover'])
+
+
+async def shows():
+    g.read_replica = True
+    filters = show_window_filters()
+
+    async def render():
+        per_page = app.config['SHOWS_PER_PAGE']
+        data = shows_page_data(await fetch(shows_page_query(
+            listing_cursor(), per_page, **show_filters(filters))), per_page)
+        return render_template('pages/shows.html', shows=data['data'],
+                               next_cursor=data['next'], filters=filters,
+                               filter_args=filter_args())
+
+    return await cached(['shows', 'venues', 'artists'], render)
+
+
+# the endpoints of app.py served by a coroutine, same URLs and templates
+ASYNC_VIEWS = {
+    'main.show_venue': show_venue,
+    'main.show_artist': show_artist,
+    'main.shows': shows
+}
+
+
+# ----------------------------------------------------------------------------#
+# ASGI.
+# ----------------------------------------------------------------------------#
+
+
+# every other request runs on the Flask app in a pool of threads, with the
+# request body read and the response streamed as the app goes
+wsgi = WSGIMiddleware(app, workers=app.config['ASGI_WSGI_THREADS'])
+
+
+async def application(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        await lifespan(receive, send)
+        return
+    if scope['type'] == 'http' and scope['method'] in ('GET', 'HEAD'):
+        environ = build_environ(scope, io.BytesIO())
+        view, kwargs = async_view(environ)
+        if view is not None:
+            await call_view(view, kwargs, environ, send)
+            return
+    await wsgi(scope, receive, send)
+
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            for engine in engines.values():
+                await engine.dispose()
+            wsgi.executor.shutdown(wait=False)
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+def async_view(environ):
+    # the coroutine of a request to one of ASYNC_VIEWS, matched by the url
+    # map of the app, and its view arguments
+    try:
+        endpoint, kwargs = app.url_map.bind_to_environ(environ).match()
+    except HTTPException:
+        return None, None
+    return ASYNC_VIEWS.get(endpoint), kwargs
+
+
+async def call_view(view, kwargs, environ, send):
+    # dispatches like Flask.full_dispatch_request, with the view awaited
+    context = app.request_context(environ)
+    context.push()
+    try:
+        try:
+            try:
+                response = app.preprocess_request()
+                if response is None:
+                    response = await view(**kwargs)
+            except Exception as error:
+                response = app.handle_user_exception(error)
+            response = app.finalize_request(response)
+        except Exception as error:
+            response = app.handle_exception(error)
+        chunks, status, headers = response.get_wsgi_response(environ)
+        await send_start(send, status, headers)
+        for chunk in chunks:
+            await send({'type': 'http.response.body', 'body': chunk,
+                        'more_body': True})
+        await send({'type': 'http.response.body', 'body': b''})
+    finally:
+        context.pop()
+
+
+async def send_start(send, status, headers):
+    await send({
+        'type': 'http.response.start',
+        'status': int(status.split(' ', 1)[0]),
+        'headers': [(name.lower().encode('latin-1'),
+                     value.encode('latin-1')) for name, value in headers]
+    })
+
+
+# ----------------------------------------------------------------------------#
+# Launch.
+# ----------------------------------------------------------------------------#
+
+if __name__ == '__main__':
+    import uvicorn
+    uvicorn.run('asgi:application')
@@ -0,0 +1,58 @@
+# ----------------------------------------------------------------------------#
+# One area on 100k venues and 1M shows: grouping every venue with
+# queries.venue_areas() and picking the area out of it, the only way to
+# get it before the area table, vs. queries.area_venues() reading the
+# area row and the (state, city) slice of the venue table. Also times the
+# statement-level triggers on a bulk show insert and one rollover.
+# ----------------------------------------------------------------------------#
+
+import time
+from datetime import datetime, timedelta
+
+from common import bench_app, reset_schema, seed, measure, report
+
+VENUES = 100000
+SHOWS = 1000000
+STATE, CITY = 'TX', 'Austin'
+
+
+def main():
+    app = bench_app()
+    from models import db, Show
+    from queries import venue_areas, area_venues
+    from rollover import rollover
+    with app.app_context():
+        reset_schema()
+        seed(venues=VENUES, artists=10000, shows=SHOWS)
+
+        def whole_table():
+            return [area for area in venue_areas()
+                    if (area['state'], area['city']) == (STATE, CITY)][0]
+
+        def one_slice():
+            return area_venues(STATE, CITY)
+
+        print('%s, %s: %d venues' % (
+            CITY, STATE, len(one_slice()['venues'])))
+        report('before (every area)', measure(whole_table, runs=5))
+        report('after (area table)', measure(one_slice, runs=50))
+
+        # the shows starting within the next minute, rolled over below
+        now = datetime.now()
+        rows = [{'venue_id': 1 + index, 'artist_id': 1 + index,
+                 'start_time': now + timedelta(seconds=index % 60),
+                 'duration': timedelta(minutes=30)}
+                for index in range(10000)]
+        start = time.perf_counter()
+        with db.get_engine().begin() as connection:
+            connection.execute(Show.__table__.insert(), rows)
+        print('insert 10k shows     %8.1fms' % (
+            (time.perf_counter() - start) * 1000))
+        start = time.perf_counter()
+        passed = rollover(now + timedelta(minutes=1))
+        print('rollover %d shows %8.1fms' % (
+            passed, (time.perf_counter() - start) * 1000))
+
+
+if __name__ == '__main__':
+    main()
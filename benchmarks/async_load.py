@@ -0,0 +1,144 @@
+# ----------------------------------------------------------------------------#
+# WSGI vs. async serving mode under 200 concurrent clients: starts the app
+# once under a threaded WSGI server and once under uvicorn (asgi.py), one
+# process each with the same pool size, and has keep-alive clients request
+# random venue and artist pages and filtered /shows pages for DURATION
+# seconds. Most pages miss the page cache (10k venues and artists vs.
+# CACHE_MAX_ENTRIES), so the database round trips are measured. Needs the
+# packages of requirements-async.txt.
+# ----------------------------------------------------------------------------#
+
+import asyncio
+import importlib.util
+import os
+import random
+import socket
+import subprocess
+import sys
+import time
+
+from common import ROOT, CITIES, bench_app, reset_schema, seed
+
+VENUES = 10000
+ARTISTS = 10000
+SHOWS = 200000
+CLIENTS = 200
+DURATION = 30
+HOST = '127.0.0.1'
+
+SERVERS = [
+    ('wsgi', 8001, [
+        sys.executable, '-c',
+        'from werkzeug.serving import run_simple\n'
+        'from app import app\n'
+        'run_simple(%r, 8001, app, threaded=True)' % HOST]),
+    ('asgi', 8002, [
+        sys.executable, '-m', 'uvicorn', 'asgi:application',
+        '--host', HOST, '--port', '8002', '--log-level', 'warning']),
+]
+
+
+def paths(rng):
+    # the read pages served by a coroutine in the async mode
+    city, state = rng.choice(CITIES)
+    return rng.choice([
+        '/venues/%d' % rng.randint(1, VENUES),
+        '/artists/%d' % rng.randint(1, ARTISTS),
+        '/shows?state=%s&city=%s' % (state, city.replace(' ', '+'))
+    ])
+
+
+async def read_response(reader):
+    status = int((await reader.readline()).split()[1])
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b''):
+            break
+        name, value = line.decode('latin-1').split(':', 1)
+        headers[name.strip().lower()] = value.strip()
+    await reader.readexactly(int(headers.get('content-length', 0)))
+    return status, headers.get('connection', '').lower() == 'close'
+
+
+async def client(port, seed, deadline, latencies, errors):
+    rng = random.Random(seed)
+    connection = None
+    while time.perf_counter() < deadline:
+        try:
+            if connection is None:
+                connection = await asyncio.open_connection(HOST, port)
+            reader, writer = connection
+            start = time.perf_counter()
+            writer.write(('GET %s HTTP/1.1\r\nHost: %s\r\n\r\n' % (
+                paths(rng), HOST)).encode())
+            await writer.drain()
+            status, close = await read_response(reader)
+            latencies.append((time.perf_counter() - start) * 1000)
+            if status != 200:
+                errors.append(status)
+            if close:
+                writer.close()
+                connection = None
+        except (OSError, asyncio.IncompleteReadError, ValueError) as error:
+            errors.append(type(error).__name__)
+            connection = None
+
+
+async def load(port):
+    latencies = []
+    errors = []
+    start = time.perf_counter()
+    deadline = start + DURATION
+    await asyncio.gather(*[client(port, index, deadline, latencies, errors)
+                           for index in range(CLIENTS)])
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    return {
+        'rps': len(latencies) / elapsed,
+        'p50': latencies[len(latencies) // 2] if latencies else 0,
+        'p95': latencies[int(len(latencies) * 0.95)] if latencies else 0,
+        'errors': len(errors)
+    }
+
+
+def wait_for(port, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection((HOST, port), 1).close()
+            return
+        except OSError:
+            time.sleep(0.2)
+    sys.exit('server on port %d did not start' % port)
+
+
+def main():
+    for module in ('a2wsgi', 'asyncpg', 'uvicorn'):
+        if importlib.util.find_spec(module) is None:
+            sys.exit('the async mode needs %s, pip install -r '
+                     'requirements-async.txt' % module)
+    app = bench_app()
+    with app.app_context():
+        reset_schema()
+        seed(venues=VENUES, artists=ARTISTS, shows=SHOWS)
+    # the same number of connections in both modes
+    env = dict(os.environ,
+               DATABASE_URL=os.environ['FYYUR_BENCH_DATABASE_URL'],
+               DB_POOL_SIZE='15', DB_ASYNC_POOL_SIZE='15',
+               DB_MAX_OVERFLOW='0')
+    for label, port, command in SERVERS:
+        server = subprocess.Popen(command, cwd=ROOT, env=env)
+        try:
+            wait_for(port)
+            result = asyncio.run(load(port))
+        finally:
+            server.terminate()
+            server.wait()
+        print('%-6s clients=%d rps=%8.1f p50=%8.2fms p95=%8.2fms '
+              'errors=%d' % (label, CLIENTS, result['rps'], result['p50'],
+                             result['p95'], result['errors']))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,98 @@
+# ----------------------------------------------------------------------------#
+# Booking race: rounds of parallel POST /shows/create for the same slot,
+# half of them for one venue with different artists and half for one
+# artist at different venues, plus one booking that overlaps the slot by
+# a minute. Exactly two may win per round, one per venue and one per
+# artist; the others must get the conflict message. Exits non-zero when a
+# double booking gets through.
+# ----------------------------------------------------------------------------#
+
+import sys
+import threading
+import time
+from datetime import datetime, timedelta
+
+from common import bench_app, reset_schema, seed
+
+VENUES = 10000
+ARTISTS = 10000
+SHOWS = 200000
+THREADS = 16
+ROUNDS = 20
+
+
+def book(app, data, results, barrier):
+    client = app.test_client()
+    barrier.wait()
+    start = time.perf_counter()
+    client.post('/shows/create', data=data)
+    with client.session_transaction() as session:
+        flashes = [message for category, message
+                   in session.get('_flashes', [])]
+    results.append((flashes, (time.perf_counter() - start) * 1000))
+
+
+def main():
+    app = bench_app()
+    app.config['WTF_CSRF_ENABLED'] = False
+    from models import db
+    with app.app_context():
+        reset_schema()
+        seed(venues=VENUES, artists=ARTISTS, shows=SHOWS)
+    # far past the seeded shows, one slot per round
+    first = datetime.now().replace(microsecond=0) + timedelta(days=3000)
+    outcomes = {}
+    timings = []
+    double_bookings = 0
+    for round in range(ROUNDS):
+        start_time = first + timedelta(days=round)
+        venue_id, artist_id = 1 + round, 1 + round
+        requests = []
+        for index in range(THREADS):
+            if index % 2:
+                requests.append((venue_id, 100 + index, start_time))
+            else:
+                requests.append((100 + index, artist_id, start_time))
+        # starts a minute before the end of the slot
+        requests.append((venue_id, 200, start_time + timedelta(minutes=119)))
+        results = []
+        barrier = threading.Barrier(len(requests))
+        threads = [threading.Thread(target=book, args=(app, {
+            'venue_id': str(venue), 'artist_id': str(artist),
+            'start_time': when.strftime('%Y-%m-%d %H:%M:%S'),
+            'duration': '120'}, results, barrier))
+            for venue, artist, when in requests]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        for flashes, milliseconds in results:
+            timings.append(milliseconds)
+            # the success message is rendered, and consumed, by the page
+            for message in flashes or ['Show was successfully listed!']:
+                outcomes[message] = outcomes.get(message, 0) + 1
+        with app.app_context():
+            booked = db.session.execute(db.text("""
+                SELECT count(*) FILTER (WHERE venue_id = :venue),
+                    count(*) FILTER (WHERE artist_id = :artist)
+                FROM show WHERE start_time >= :start
+                AND start_time < :start + interval '1 day'"""), {
+                'venue': venue_id, 'artist': artist_id,
+                'start': start_time}).one()
+            db.session.remove()
+        if tuple(booked) != (1, 1):
+            double_bookings += 1
+            print('round %d: %d venue and %d artist bookings' % (
+                round, booked[0], booked[1]))
+    timings.sort()
+    print('%d rounds of %d parallel bookings' % (ROUNDS, THREADS + 1))
+    for message, count in sorted(outcomes.items()):
+        print('  %5d  %s' % (count, message))
+    print('latency p50=%.1fms p95=%.1fms' % (
+        timings[len(timings) // 2], timings[int(len(timings) * 0.95)]))
+    if double_bookings:
+        sys.exit('%d rounds let a double booking through' % double_bookings)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,74 @@
+# ----------------------------------------------------------------------------#
+# Bulk import: venues added one at a time through the ORM with a commit per
+# row, as create_venue_submission does, vs. importer.import_stream on the
+# same CSV. Prints rows/sec of both.
+# ----------------------------------------------------------------------------#
+
+import csv
+import io
+import random
+import time
+
+from common import bench_app, reset_schema, CITIES, GENRES, name
+
+ROWS = 20000
+LEGACY_ROWS = 2000
+FIELDS = ['name', 'city', 'state', 'address', 'phone', 'genres',
+          'image_link', 'facebook_link', 'website_link', 'seeking_talent']
+
+
+def venues_csv(rows, seed=42):
+    rng = random.Random(seed)
+    out = io.StringIO()
+    writer = csv.DictWriter(out, FIELDS)
+    writer.writeheader()
+    for index in range(rows):
+        city, state = rng.choice(CITIES)
+        writer.writerow({
+            'name': name(rng, index), 'city': city, 'state': state,
+            'address': '%d Main St' % index, 'phone': '123-123-1234',
+            'genres': ';'.join(rng.sample(GENRES, 2)),
+            'image_link': 'https://example.com/v/%d.jpg' % index,
+            'facebook_link': 'https://facebook.com/v%d' % index,
+            'website_link': 'https://example.com/%d' % index,
+            'seeking_talent': rng.choice(['true', 'false'])
+        })
+    out.seek(0)
+    return out
+
+
+def legacy_import(stream):
+    # one Venue per row, each in its own transaction
+    from models import db, Venue
+    for record in csv.DictReader(stream):
+        db.session.add(Venue(
+            name=record['name'], city=record['city'],
+            state=record['state'], address=record['address'],
+            phone=record['phone'], image_link=record['image_link'],
+            facebook_link=record['facebook_link'],
+            seeking_talent=record['seeking_talent'] == 'true',
+            website=record['website_link'],
+            genres=record['genres'].split(';')))
+        db.session.commit()
+    db.session.remove()
+
+
+def main():
+    app = bench_app()
+    from importer import import_stream
+    with app.app_context():
+        reset_schema()
+        start = time.perf_counter()
+        legacy_import(venues_csv(LEGACY_ROWS))
+        seconds = time.perf_counter() - start
+        print('%-28s rows=%-6d %8.0f rows/s' % (
+            'before (commit per row)', LEGACY_ROWS, LEGACY_ROWS / seconds))
+        report = import_stream('venues', venues_csv(ROWS), 'csv')
+        assert report['failed'] == 0, report['errors'][:5]
+        print('%-28s rows=%-6d %8.0f rows/s' % (
+            'after (chunked import)', report['rows'],
+            report['rows_per_second']))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,167 @@
+# ----------------------------------------------------------------------------#
+# Shared helpers for the benchmark scripts.
+#
+# The benchmarks wipe and seed the database given in
+# FYYUR_BENCH_DATABASE_URL, never the one configured in config.py, e.g.
+#   FYYUR_BENCH_DATABASE_URL=postgresql://localhost/fyyur_bench \
+#       python benchmarks/venues_listing.py
+# ----------------------------------------------------------------------------#
+
+import os
+import random
+import sys
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+CITIES = [('San Francisco', 'CA'), ('Los Angeles', 'CA'), ('New York', 'NY'),
+          ('Austin', 'TX'), ('Seattle', 'WA'), ('Chicago', 'IL'),
+          ('Boston', 'MA'), ('Denver', 'CO'), ('Portland', 'OR'),
+          ('Miami', 'FL')]
+GENRES = ['Alternative', 'Blues', 'Classical', 'Country', 'Electronic',
+          'Folk', 'Funk', 'Hip-Hop', 'Heavy Metal', 'Instrumental', 'Jazz',
+          'Musical Theatre', 'Pop', 'Punk', 'R&B', 'Reggae', 'Rock n Roll',
+          'Soul', 'Other']
+WORDS = ['The', 'Musical', 'Hop', 'Park', 'Square', 'Live', 'Music',
+         'Coffee', 'Dueling', 'Pianos', 'Bar', 'Guns', 'Petals', 'Wild',
+         'Sax', 'Band', 'Hall', 'Club', 'Lounge', 'Garden', 'Room', 'Cellar']
+
+
+def bench_app():
+    # to point the app at the scratch database before any engine exists
+    url = os.environ.get('FYYUR_BENCH_DATABASE_URL')
+    if not url:
+        sys.exit('FYYUR_BENCH_DATABASE_URL must point at a scratch '
+                 'postgres database, its tables are dropped and reseeded.')
+    # seeding and the legacy code paths may outlast the statement timeout
+    os.environ.setdefault('DB_STATEMENT_TIMEOUT', '0')
+    # the requests do not run the rollover, the statements counted and
+    # timed are those of the views
+    os.environ.setdefault('ROLLOVER_INTERVAL', '0')
+    import config
+    config.SQLALCHEMY_DATABASE_URI = url
+    from app import app
+    app.config['SQLALCHEMY_DATABASE_URI'] = url
+    return app
+
+
+def reset_schema():
+    # drop everything and run the migrations, must be called inside
+    # an app context
+    from flask_migrate import upgrade
+    from models import db
+    with db.get_engine().begin() as connection:
+        connection.exec_driver_sql('DROP SCHEMA public CASCADE')
+        connection.exec_driver_sql('CREATE SCHEMA public')
+    upgrade(directory=os.path.join(ROOT, 'migrations'))
+
+
+def name(rng, index):
+    return '%s %s %d' % (rng.choice(WORDS), rng.choice(WORDS), index)
+
+
+def seed(venues, artists, shows, chunk=10000, seed=42):
+    # to bulk insert deterministic fake data, must be called inside an
+    # app context
+    from models import db, Venue, Artist, Show
+    rng = random.Random(seed)
+    now = datetime.now()
+    engine = db.get_engine()
+
+    def insert(table, rows):
+        with engine.begin() as connection:
+            for start in range(0, len(rows), chunk):
+                connection.execute(table.insert(), rows[start:start + chunk])
+
+    venue_rows = []
+    for index in range(venues):
+        city, state = rng.choice(CITIES)
+        venue_rows.append({
+            'name': name(rng, index), 'city': city, 'state': state,
+            'address': '%d Main St' % index, 'phone': '123-123-1234',
+            'image_link': 'https://example.com/v/%d.jpg' % index,
+            'facebook_link': 'https://facebook.com/v%d' % index,
+            'seeking_talent': rng.random() < 0.5,
+            'genres': rng.sample(GENRES, 2)
+        })
+    insert(Venue.__table__, venue_rows)
+    artist_rows = []
+    for index in range(artists):
+        city, state = rng.choice(CITIES)
+        artist_rows.append({
+            'name': name(rng, index), 'city': city, 'state': state,
+            'phone': '123-123-1234',
+            'image_link': 'https://example.com/a/%d.jpg' % index,
+            'facebook_link': 'https://facebook.com/a%d' % index,
+            'seeking_venue': rng.random() < 0.5,
+            'genres': rng.sample(GENRES, 2)
+        })
+    insert(Artist.__table__, artist_rows)
+    # shows last two hours and start on even hours, never twice in the
+    # same slot for a venue or an artist. The slot starting now is left
+    # free for the benchmarks that book shows themselves
+    show_rows = []
+    venue_slots = set()
+    artist_slots = set()
+    while len(show_rows) < shows:
+        venue_id = rng.randint(1, venues)
+        artist_id = rng.randint(1, artists)
+        slot = rng.randint(-12000, 4000)
+        if slot == 0 or (venue_id, slot) in venue_slots or \
+                (artist_id, slot) in artist_slots:
+            continue
+        venue_slots.add((venue_id, slot))
+        artist_slots.add((artist_id, slot))
+        show_rows.append({
+            'venue_id': venue_id,
+            'artist_id': artist_id,
+            'start_time': now + timedelta(hours=2 * slot)
+        })
+    insert(Show.__table__, show_rows)
+    # as autovacuum would, to flush the GIN pending lists and refresh
+    # the planner statistics
+    with engine.connect().execution_options(
+            isolation_level='AUTOCOMMIT') as connection:
+        connection.exec_driver_sql('VACUUM ANALYZE')
+
+
+@contextmanager
+def count_queries():
+    # to count every statement sent to the database inside the block
+    from sqlalchemy import event
+    from sqlalchemy.engine import Engine
+    counter = {'queries': 0}
+
+    def before_cursor_execute(*args, **kwargs):
+        counter['queries'] += 1
+
+    event.listen(Engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        yield counter
+    finally:
+        event.remove(Engine, 'before_cursor_execute', before_cursor_execute)
+
+
+def measure(function, runs):
+    # returns the query count of one call and the p50/p95 latency in ms
+    with count_queries() as counter:
+        function()
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        function()
+        timings.append((time.perf_counter() - start) * 1000)
+    timings.sort()
+    return {
+        'queries': counter['queries'],
+        'p50': timings[len(timings) // 2],
+        'p95': timings[min(len(timings) - 1, int(len(timings) * 0.95))]
+    }
+
+
+def report(label, result):
+    print('%-28s queries=%-7d p50=%9.2fms p95=%9.2fms' % (
+        label, result['queries'], result['p50'], result['p95']))
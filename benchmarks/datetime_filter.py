@@ -0,0 +1,56 @@
+# ----------------------------------------------------------------------------#
+# datetime template filter: the dateutil/Babel round trip on strings vs.
+# filters.format_datetime on datetime objects, over 100k timestamps drawn
+# from 5k distinct show start times. No database needed.
+# ----------------------------------------------------------------------------#
+
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+import babel.dates
+import dateutil.parser
+
+# to put the app on sys.path, as common.py does for the other benchmarks
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from filters import format_datetime, render_datetime  # noqa: E402
+
+
+def legacy_format_datetime(value, format='medium'):
+    # the filter as it was defined in app.py
+    date = dateutil.parser.parse(value)
+    if format == 'full':
+        format = "EEEE MMMM, d, y 'at' h:mma"
+    elif format == 'medium':
+        format = "EE MM, dd, y h:mma"
+    return babel.dates.format_datetime(date, format, locale='en')
+
+
+def timed(label, function, values):
+    start = time.perf_counter()
+    results = [function(value, 'full') for value in values]
+    elapsed = time.perf_counter() - start
+    print('%-36s %8.1fms  %6.2fus/call' % (
+        label, elapsed * 1000, elapsed / len(values) * 1e6))
+    return results
+
+
+def main():
+    rng = random.Random(42)
+    start = datetime(2022, 1, 1, 20, 0)
+    distinct = [start + timedelta(minutes=30 * rng.randint(0, 50000))
+                for _ in range(5000)]
+    values = [rng.choice(distinct) for _ in range(100000)]
+
+    before = timed('before (str -> parse -> babel)', legacy_format_datetime,
+                   [str(value) for value in values])
+    render_datetime.cache_clear()
+    after = timed('after (datetime, cold cache)', format_datetime, values)
+    timed('after (datetime, warm cache)', format_datetime, values)
+    assert before == after, 'formatted output changed'
+
+
+if __name__ == '__main__':
+    main()
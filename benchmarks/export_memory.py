@@ -0,0 +1,58 @@
+# ----------------------------------------------------------------------------#
+# Show export: Show.query.all() serialised from a list, as shows() used to
+# load the table, vs. exporter.export_rows streaming through a server side
+# cursor. Prints the peak Python memory and the time of both on 500k shows.
+# ----------------------------------------------------------------------------#
+
+import csv
+import io
+import time
+import tracemalloc
+
+from common import bench_app, reset_schema, seed
+
+SHOWS = 500000
+
+
+def legacy_export():
+    from models import Show
+    out = io.StringIO()
+    writer = csv.writer(out)
+    for show in Show.query.all():
+        writer.writerow([show.id, show.artist_id, show.venue_id,
+                         show.start_time])
+        # to keep only what a response would still have to send
+        out.seek(0)
+        out.truncate()
+
+
+def streamed_export():
+    from exporter import export_rows
+    for text in export_rows('shows', 'csv'):
+        pass
+
+
+def traced(label, function):
+    from models import db
+    tracemalloc.start()
+    start = time.perf_counter()
+    function()
+    seconds = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    db.session.remove()
+    print('%-28s peak=%8.1fMB time=%6.2fs' % (
+        label, peak / 1024 / 1024, seconds))
+
+
+def main():
+    app = bench_app()
+    with app.app_context():
+        reset_schema()
+        seed(venues=1000, artists=1000, shows=SHOWS)
+        traced('before (query.all)', legacy_export)
+        traced('after (server side cursor)', streamed_export)
+
+
+if __name__ == '__main__':
+    main()
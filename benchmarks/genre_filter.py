@@ -0,0 +1,62 @@
+# ----------------------------------------------------------------------------#
+# Genre + state filtering on 100k venues and 100k artists: without the
+# genre and state indexes (dropped inside a transaction that is rolled
+# back) vs. the GIN index on genres combined with the index on state.
+# Prints the plan and latency of "all Jazz venues in CA" and of a two
+# genre filter.
+# ----------------------------------------------------------------------------#
+
+from common import bench_app, reset_schema, seed, measure, report
+
+VENUES = 100000
+ARTISTS = 100000
+FILTERS = [
+    (['Jazz'], 'CA'),
+    (['Jazz', 'Blues'], 'TX'),
+]
+
+
+def plan(query):
+    from models import db
+    statement = query.statement.compile(dialect=db.engine.dialect)
+    rows = db.session.connection().exec_driver_sql(
+        'EXPLAIN ' + str(statement), statement.params)
+    return [line for (line,) in rows if 'Scan' in line or 'BitmapAnd' in line]
+
+
+def main():
+    app = bench_app()
+    from models import db, Venue, Artist
+    from queries import venue_areas, entity_filters
+    with app.app_context():
+        reset_schema()
+        seed(venues=VENUES, artists=ARTISTS, shows=VENUES)
+        for genres, state in FILTERS:
+            label = '%s in %s' % ('+'.join(genres), state)
+
+            def venues():
+                return venue_areas(genres, state)
+
+            def artists():
+                return db.session.query(Artist.id, Artist.name).filter(
+                    *entity_filters(Artist, genres, state)).all()
+
+            hits = sum(len(area['venues']) for area in venues())
+            print('%s: %d venues, %d artists' % (
+                label, hits, len(artists())))
+            query = db.session.query(Venue.id).filter(
+                *entity_filters(Venue, genres, state))
+            db.session.execute(db.text(
+                'DROP INDEX ix_venue_genres, ix_venue_state_city, '
+                'ix_artist_genres, ix_artist_state'))
+            print('  ' + '\n  '.join(plan(query)))
+            report('  venues, seq scan', measure(venues, runs=20))
+            report('  artists, seq scan', measure(artists, runs=20))
+            db.session.rollback()
+            print('  ' + '\n  '.join(plan(query)))
+            report('  venues, indexed', measure(venues, runs=20))
+            report('  artists, indexed', measure(artists, runs=20))
+
+
+if __name__ == '__main__':
+    main()
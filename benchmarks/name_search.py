@@ -0,0 +1,34 @@
+# ----------------------------------------------------------------------------#
+# Venue/artist name search: sequential scan vs. the pg_trgm GIN indexes.
+# Seeds 300k venues and 300k artists.
+# ----------------------------------------------------------------------------#
+
+from common import bench_app, reset_schema, seed, measure, report
+
+TERMS = ['hop', 'garden 42', 'cellar 1999', 'sax band 7']
+
+
+def main():
+    app = bench_app()
+    from models import db, Venue, Artist
+    from queries import search
+    with app.app_context():
+        reset_schema()
+        seed(venues=300000, artists=300000, shows=0)
+
+        def run():
+            for term in TERMS:
+                search(Venue, term)
+                search(Artist, term)
+
+        # to make the planner ignore the trigram indexes
+        db.session.execute(db.text('SET enable_bitmapscan = off'))
+        db.session.execute(db.text('SET enable_indexscan = off'))
+        report('sequential scan', measure(run, runs=10))
+        db.session.execute(db.text('RESET enable_bitmapscan'))
+        db.session.execute(db.text('RESET enable_indexscan'))
+        report('trigram index', measure(run, runs=10))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,66 @@
+# ----------------------------------------------------------------------------#
+# SQL statement budget per endpoint: hits every read endpoint on a small
+# seeded dataset and exits non-zero when one issues more statements than
+# its budget, e.g. after a relationship starts lazy loading per row.
+# ----------------------------------------------------------------------------#
+
+import sys
+from datetime import date, timedelta
+
+from common import bench_app, reset_schema, seed, count_queries
+
+# the coming week of shows, for the time window filters
+WEEK = (date.today().isoformat(),
+        (date.today() + timedelta(days=7)).isoformat())
+# and the month of the calendar
+MONTH = date.today().strftime('%Y-%m')
+
+# (method, url, form data, statement budget)
+BUDGETS = [
+    ('get', '/', None, 2),
+    ('get', '/venues', None, 2),
+    ('get', '/venues/area/TX/Austin', None, 2),
+    ('get', '/artists', None, 2),
+    ('get', '/shows', None, 1),
+    ('get', '/shows?from=%s&to=%s&city=Austin&state=TX' % WEEK, None, 1),
+    ('get', '/shows/calendar?month=%s' % MONTH, None, 1),
+    ('get', '/venues/1/shows.ics', None, 3),
+    ('get', '/venues/1', None, 4),
+    ('get', '/artists/1', None, 4),
+    ('get', '/venues/1/edit', None, 1),
+    ('get', '/artists/1/edit', None, 1),
+    ('post', '/venues/search', {'search_term': 'hop'}, 1),
+    ('post', '/artists/search', {'search_term': 'hop'}, 1),
+    ('get', '/api/v1/venues', None, 1),
+    ('get', '/api/v1/artists?fields=id,name,num_upcoming_shows', None, 1),
+    ('get', '/api/v1/shows', None, 1),
+    ('get', '/api/v1/venues/1?fields=name,genres', None, 1),
+    ('get', '/api/v1/artists/1', None, 4),
+]
+
+
+def main():
+    app = bench_app()
+    from models import db
+    failures = 0
+    with app.app_context():
+        reset_schema()
+        seed(venues=50, artists=50, shows=1000)
+        client = app.test_client()
+        for method, url, data, budget in BUDGETS:
+            # to start every request from an empty identity map
+            db.session.remove()
+            with count_queries() as counter:
+                response = getattr(client, method)(url, data=data)
+            over = counter['queries'] > budget or \
+                response.status_code != 200
+            failures += over
+            print('%-5s %-50s %d  queries=%-4d budget=%-3d %s' % (
+                method.upper(), url, response.status_code,
+                counter['queries'], budget, 'OVER' if over else 'ok'))
+    if failures:
+        sys.exit('%d endpoint(s) over their statement budget' % failures)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,95 @@
+# ----------------------------------------------------------------------------#
+# Query plan regression check: EXPLAINs every statement issued by the
+# listing, detail and search endpoints on a seeded dataset and exits
+# non-zero when one of them reads an indexed table with a sequential scan.
+# ----------------------------------------------------------------------------#
+
+import sys
+from datetime import date, timedelta
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from common import bench_app, reset_schema, seed
+
+# the coming week of shows, for the time window filters
+WEEK = (date.today().isoformat(),
+        (date.today() + timedelta(days=7)).isoformat())
+# and the month of the calendar
+MONTH = date.today().strftime('%Y-%m')
+
+# (method, url, form data, tables that must not be sequentially scanned)
+ENDPOINTS = [
+    ('get', '/venues', None, {'show'}),
+    ('get', '/venues/area/TX/Austin', None, {'show', 'venue'}),
+    ('get', '/shows?from=%s&to=%s&city=Austin&state=TX' % WEEK, None,
+     {'show'}),
+    ('get', '/shows/calendar?month=%s' % MONTH, None, {'show'}),
+    ('get', '/venues/1/shows.ics', None, {'show'}),
+    ('get', '/venues/1', None, {'show'}),
+    ('get', '/artists/1', None, {'show'}),
+    ('post', '/venues/search', {'search_term': 'garden 4242'},
+     {'show', 'venue'}),
+    ('post', '/artists/search', {'search_term': 'garden 4242'},
+     {'show', 'artist'}),
+]
+
+
+def capture(client, method, url, data):
+    # to record every statement (and its parameters) a request issues
+    statements = []
+
+    def before_cursor_execute(connection, cursor, statement, parameters,
+                              context, executemany):
+        statements.append((statement, parameters))
+
+    event.listen(Engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        response = getattr(client, method)(url, data=data)
+    finally:
+        event.remove(Engine, 'before_cursor_execute', before_cursor_execute)
+    if response.status_code != 200:
+        sys.exit('%s %s returned %d' % (
+            method.upper(), url, response.status_code))
+    return statements
+
+
+def sequential_scans(node):
+    # to walk an EXPLAIN (FORMAT JSON) plan tree
+    if node['Node Type'] == 'Seq Scan':
+        yield node['Relation Name']
+    for child in node.get('Plans', []):
+        yield from sequential_scans(child)
+
+
+def main():
+    app = bench_app()
+    from models import db
+    failures = 0
+    with app.app_context():
+        reset_schema()
+        seed(venues=10000, artists=10000, shows=200000)
+        client = app.test_client()
+        engine = db.get_engine()
+        for method, url, data, tables in ENDPOINTS:
+            for statement, parameters in capture(client, method, url, data):
+                if not statement.lstrip().upper().startswith('SELECT'):
+                    continue
+                with engine.connect() as connection:
+                    plan = connection.exec_driver_sql(
+                        'EXPLAIN (FORMAT JSON) ' + statement,
+                        parameters).scalar()[0]['Plan']
+                scanned = set(sequential_scans(plan)) & tables
+                status = 'ok'
+                if scanned:
+                    failures += 1
+                    status = 'SEQ SCAN on %s' % ', '.join(sorted(scanned))
+                print('%-5s %-24s %s' % (method.upper(), url, status))
+                if scanned:
+                    print('      ' + ' '.join(statement.split())[:300])
+    if failures:
+        sys.exit('%d statement(s) fell back to a sequential scan' % failures)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,131 @@
+# ----------------------------------------------------------------------------#
+# Read replica routing: a second scratch database stands in for a replica
+# that never catches up. Checks that the marked views read from it, that
+# writes and the other views use the primary, and that reads stay on the
+# primary for REPLICA_STICKY_SECONDS after a write. Exits non-zero when a
+# check fails.
+# ----------------------------------------------------------------------------#
+
+import os
+import sys
+import time
+from contextlib import contextmanager
+
+from common import bench_app, reset_schema, seed
+
+STICKY_SECONDS = 1
+
+
+@contextmanager
+def count_by_engine(engines):
+    # statements sent through each named engine inside the block
+    from sqlalchemy import event
+    counts = dict.fromkeys(engines, 0)
+    listeners = []
+    for label, engine in engines.items():
+        def before_cursor_execute(*args, label=label, **kwargs):
+            counts[label] += 1
+        event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+        listeners.append((engine, before_cursor_execute))
+    try:
+        yield counts
+    finally:
+        for engine, listener in listeners:
+            event.remove(engine, 'before_cursor_execute', listener)
+
+
+def copy_to_replica(primary, replica):
+    # the replica gets the schema and a copy of the rows, its venue names
+    # are marked to tell which database answered
+    from models import db
+    with replica.begin() as connection:
+        connection.exec_driver_sql('DROP SCHEMA public CASCADE')
+        connection.exec_driver_sql('CREATE SCHEMA public')
+        connection.exec_driver_sql('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+        connection.exec_driver_sql('CREATE EXTENSION IF NOT EXISTS btree_gist')
+    db.metadata.create_all(replica)
+    with primary.connect() as source, replica.begin() as target:
+        for table in db.metadata.sorted_tables:
+            rows = [dict(row._mapping) for row in source.execute(
+                table.select())]
+            if rows:
+                target.execute(table.insert(), rows)
+        target.exec_driver_sql(
+            "UPDATE venue SET name = name || ' (replica)'")
+
+
+def main():
+    replica_url = os.environ.get('FYYUR_BENCH_REPLICA_URL')
+    if not replica_url:
+        sys.exit('FYYUR_BENCH_REPLICA_URL must point at a second scratch '
+                 'postgres database, its tables are dropped and reseeded.')
+    import config
+    config.SQLALCHEMY_REPLICA_URIS = [replica_url]
+    config.REPLICA_STICKY_SECONDS = STICKY_SECONDS
+    config.WTF_CSRF_ENABLED = False
+    app = bench_app()
+    from models import db
+    failures = []
+
+    def check(label, passed):
+        print('%-52s %s' % (label, 'ok' if passed else 'FAILED'))
+        if not passed:
+            failures.append(label)
+
+    with app.app_context():
+        reset_schema()
+        seed(venues=5, artists=5, shows=20)
+        engines = {
+            'primary': db.get_engine(),
+            'replica': db.get_engine(app, 'replica_0')
+        }
+        copy_to_replica(engines['primary'], engines['replica'])
+
+    writer = app.test_client()
+    with count_by_engine(engines) as counts:
+        for url in ['/', '/venues', '/artists', '/shows', '/shows.json',
+                    '/venues/1', '/artists/1']:
+            writer.get(url)
+        writer.post('/venues/search', data={'search_term': 'a'})
+        writer.post('/artists/search', data={'search_term': 'a'})
+    check('read views use the replica only (%(primary)d/%(replica)d)'
+          % counts, counts['primary'] == 0 and counts['replica'] > 0)
+    with count_by_engine(engines) as counts:
+        response = writer.get('/venues/1/edit')
+    check('edit form reads from the primary',
+          counts['replica'] == 0 and b'(replica)' not in response.data)
+
+    with count_by_engine(engines) as counts:
+        writer.post('/venues/create', data={
+            'name': 'Freshly Written Venue', 'city': 'San Francisco',
+            'state': 'CA', 'address': '1 Main St', 'phone': '123-123-1234',
+            'genres': ['Jazz'], 'facebook_link': 'https://facebook.com/v',
+            'image_link': 'https://example.com/v.jpg',
+            'website_link': 'https://example.com'
+        })
+    check('create writes to the primary only',
+          counts['replica'] == 0 and counts['primary'] > 0)
+
+    response = app.test_client().get('/venues?after=write')
+    check('this process reads the primary right after a write',
+          b'Freshly Written Venue' in response.data)
+    # as seen from another worker, only the writer's cookie is sticky
+    app.extensions['replicas']['last_write'] = 0
+    response = writer.get('/venues?after=write-other-worker')
+    check('writer reads its own write on another worker',
+          b'Freshly Written Venue' in response.data)
+    response = app.test_client().get('/venues?after=write-other-client')
+    check('other clients on another worker read the replica',
+          b'(replica)' in response.data)
+    time.sleep(STICKY_SECONDS + 0.5)
+    response = writer.get('/venues?after=sticky-window')
+    check('writer is back on the replica after the sticky window',
+          b'(replica)' in response.data and
+          b'Freshly Written Venue' not in response.data)
+
+    if failures:
+        sys.exit('%d replica routing check(s) failed' % len(failures))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,170 @@
+# ----------------------------------------------------------------------------#
+# Upcoming show counters on 100k venues, 100k artists and 1M shows: the
+# listings and searches with a correlated COUNT per row, as they were
+# built before the counter columns, vs. reading the columns. Then runs
+# writers inserting, moving and deleting shows and moving venues between
+# areas concurrently with rollovers, and exits non-zero when a counter or
+# an area count disagrees with the shows table.
+# ----------------------------------------------------------------------------#
+
+import random
+import sys
+import threading
+import time
+from datetime import datetime, timedelta
+
+from common import bench_app, reset_schema, seed, measure, report, CITIES
+
+VENUES = 100000
+ARTISTS = 100000
+SHOWS = 1000000
+WRITERS = 8
+SECONDS = 20
+
+
+def counted(model):
+    # the correlated count the listings used before the counters
+    from models import db, Show
+    foreign_key = Show.venue_id if model.__tablename__ == 'venue' \
+        else Show.artist_id
+    return db.session.query(db.func.count()).filter(
+        foreign_key == model.id,
+        Show.start_time > datetime.now()).scalar_subquery()
+
+
+def writer(app, seed, stop, errors):
+    from sqlalchemy.exc import IntegrityError
+    from sqlalchemy.orm.exc import StaleDataError
+    from models import db, Venue, Show
+    rng = random.Random(seed)
+    with app.app_context():
+        while not stop.is_set():
+            try:
+                action = rng.random()
+                if action < 0.5:
+                    db.session.add(Show(
+                        venue_id=rng.randint(1, 50),
+                        artist_id=rng.randint(1, 50),
+                        start_time=datetime.now() + timedelta(
+                            microseconds=rng.randint(-5000000, 5000000)),
+                        duration=timedelta(milliseconds=1)))
+                elif action < 0.7:
+                    show = Show.query.filter(
+                        Show.venue_id <= 50).order_by(
+                        db.func.random()).first()
+                    show.venue_id = rng.randint(1, 50)
+                    show.start_time = datetime.now() + timedelta(
+                        microseconds=rng.randint(-5000000, 5000000))
+                elif action < 0.9:
+                    Show.query.filter(Show.id == db.session.query(
+                        db.func.max(Show.id)).scalar_subquery()).delete(
+                        synchronize_session=False)
+                else:
+                    venue = Venue.query.get(rng.randint(1, 50))
+                    venue.city, venue.state = rng.choice(CITIES)
+                db.session.commit()
+            except (StaleDataError, IntegrityError):
+                # the show was deleted by another writer meanwhile, or
+                # the venue or the artist is already booked
+                db.session.rollback()
+            except Exception as error:
+                db.session.rollback()
+                errors.append(error)
+        db.session.remove()
+
+
+def roller(app, stop, errors):
+    from rollover import rollover
+    with app.app_context():
+        while not stop.is_set():
+            try:
+                rollover()
+            except Exception as error:
+                errors.append(error)
+            time.sleep(0.2)
+
+
+def mismatches():
+    from models import db
+    rolled_at = '(SELECT rolled_at FROM show_rollover)'
+    found = 0
+    for table in ('venue', 'artist'):
+        found += db.session.execute(db.text("""
+            SELECT count(*) FROM %(table)s t JOIN (
+                SELECT t.id,
+                    count(s.id) FILTER (WHERE s.start_time > %(at)s) AS up,
+                    count(s.id) FILTER (WHERE s.start_time <= %(at)s) AS past
+                FROM %(table)s t LEFT JOIN show s ON s.%(table)s_id = t.id
+                GROUP BY t.id) c ON c.id = t.id
+            WHERE (t.upcoming_shows_count, t.past_shows_count) <>
+                (c.up, c.past)""" % {'table': table, 'at': rolled_at})
+        ).scalar()
+    found += db.session.execute(db.text("""
+        SELECT count(*) FROM (
+            SELECT v.state, v.city, count(DISTINCT v.id) AS venues,
+                count(s.id) FILTER (WHERE s.start_time > %s) AS up
+            FROM venue v LEFT JOIN show s ON s.venue_id = v.id
+            GROUP BY v.state, v.city) c
+        FULL JOIN area a USING (state, city)
+        WHERE (a.num_venues, a.num_upcoming_shows) IS DISTINCT FROM
+            (c.venues, c.up)""" % rolled_at)).scalar()
+    return found
+
+
+def main():
+    app = bench_app()
+    from models import db, Venue, Artist
+    with app.app_context():
+        reset_schema()
+        seed(venues=VENUES, artists=ARTISTS, shows=SHOWS)
+        # seeding inserts every show in one transaction, each venue and
+        # artist row is rewritten once per chunk with no chance for the
+        # dead versions to be pruned. Compacted as a running table would be
+        with db.get_engine().connect().execution_options(
+                isolation_level='AUTOCOMMIT') as connection:
+            connection.exec_driver_sql('VACUUM FULL ANALYZE venue, artist')
+
+        def venues(count):
+            return lambda: db.session.query(
+                Venue.id, Venue.name, Venue.city, Venue.state, count
+            ).order_by(Venue.city, Venue.state, Venue.id).all()
+
+        def searched(count):
+            return lambda: db.session.query(
+                Artist.id, Artist.name, count).filter(
+                Artist.name.ilike('%garden 4%')).order_by(
+                Artist.name).limit(20).all()
+
+        report('venues, correlated count',
+               measure(venues(counted(Venue)), runs=5))
+        report('venues, counter column',
+               measure(venues(Venue.upcoming_shows_count), runs=5))
+        report('search, correlated count',
+               measure(searched(counted(Artist)), runs=20))
+        report('search, counter column',
+               measure(searched(Artist.upcoming_shows_count), runs=20))
+        db.session.remove()
+
+        stop = threading.Event()
+        errors = []
+        threads = [threading.Thread(target=writer, args=(
+            app, index, stop, errors)) for index in range(WRITERS)]
+        threads.append(threading.Thread(target=roller, args=(
+            app, stop, errors)))
+        for thread in threads:
+            thread.start()
+        time.sleep(SECONDS)
+        stop.set()
+        for thread in threads:
+            thread.join()
+        for error in errors[:5]:
+            print('error: %s' % str(error).splitlines()[0])
+        found = mismatches()
+        print('%d writers for %ds: %d errors, %d counters off' % (
+            WRITERS, SECONDS, len(errors), found))
+        if errors or found:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,62 @@
+# ----------------------------------------------------------------------------#
+# Shows in a time window and a city on 100k venues and 1M shows: the
+# filtered /shows page and one month of the calendar, each read from the
+# (start_time, id) index joined to the venue, vs. the ics feed of the
+# busiest venue generated and then served from the cache.
+# ----------------------------------------------------------------------------#
+
+from datetime import date, timedelta
+
+from common import bench_app, reset_schema, seed, measure, report
+
+VENUES = 100000
+SHOWS = 1000000
+STATE, CITY = 'TX', 'Austin'
+
+
+def main():
+    app = bench_app()
+    from models import db, Show, Venue
+    from queries import shows_page, calendar_shows
+    from calendars import calendar_rows
+    from cache import cached_stream
+    with app.app_context():
+        reset_schema()
+        seed(venues=VENUES, artists=10000, shows=SHOWS)
+        today = date.today()
+
+        def week_in_city():
+            return shows_page(None, 30, start=today,
+                              end=today + timedelta(days=7),
+                              city=CITY, state=STATE)
+
+        def month_everywhere():
+            return calendar_shows(today, today + timedelta(days=34), 3)
+
+        def month_in_state():
+            return calendar_shows(today, today + timedelta(days=34), 3,
+                                  state=STATE)
+
+        report('week in %s' % CITY, measure(week_in_city, runs=50))
+        report('calendar month', measure(month_everywhere, runs=20))
+        report('calendar month in %s' % STATE,
+               measure(month_in_state, runs=20))
+
+        venue_id, = db.session.query(Show.venue_id).group_by(
+            Show.venue_id).order_by(db.func.count().desc()).first()
+        name = db.session.get(Venue, venue_id).name
+
+        def generated():
+            return ''.join(calendar_rows(Venue, venue_id, name,
+                                         'http://localhost/'))
+
+        print('venue %d: %d bytes of ics' % (venue_id, len(generated())))
+        report('ics generated', measure(generated, runs=20))
+        report('ics from cache', measure(lambda: ''.join(cached_stream(
+            'ics:bench', ['venue:%d' % venue_id], lambda: calendar_rows(
+                Venue, venue_id, name, 'http://localhost/'),
+            max_size=16 * 1024 * 1024)), runs=20))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,53 @@
+# ----------------------------------------------------------------------------#
+# /venues listing: per-venue COUNT queries vs. a single grouped query.
+# Seeds 10k venues and 200k shows.
+# ----------------------------------------------------------------------------#
+
+from datetime import datetime
+
+from common import bench_app, reset_schema, seed, measure, report
+
+
+def legacy_venue_areas(db, Venue, Show):
+    # the listing as it was built before queries.venue_areas()
+    data = []
+    venues = Venue.query.all()
+    unique_venues = Venue.query.distinct(Venue.city, Venue.state).all()
+    current_time = datetime.now()
+    for unique_venue in unique_venues:
+        venue_data = []
+        for venue in venues:
+            if unique_venue.city == venue.city:
+                venue_data.append({
+                    'id': venue.id,
+                    'name': venue.name,
+                    'num_upcoming_shows': Show.query.filter(db.and_(
+                        Show.start_time > current_time,
+                        Show.venue_id == venue.id)).count()
+                })
+        data.append({
+            'city': unique_venue.city,
+            'state': unique_venue.state,
+            'venues': venue_data
+        })
+    return data
+
+
+def main():
+    app = bench_app()
+    from models import db, Venue, Show
+    from queries import venue_areas
+    with app.app_context():
+        reset_schema()
+        seed(venues=10000, artists=2000, shows=200000)
+
+        def legacy():
+            legacy_venue_areas(db, Venue, Show)
+            db.session.expunge_all()
+
+        report('before (N+1 counts)', measure(legacy, runs=3))
+        report('after (grouped query)', measure(venue_areas, runs=50))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,378 @@
+# ----------------------------------------------------------------------------#
+# Imports
+# ----------------------------------------------------------------------------#
+
+import hashlib
+import pickle
+import threading
+import time
+from collections import OrderedDict
+from datetime import timezone
+from functools import wraps
+from itertools import chain
+from flask import (
+    current_app,
+    request,
+    session,
+    get_flashed_messages,
+    make_response
+)
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+from models import Venue, Artist, Show
+
+
+# ----------------------------------------------------------------------------#
+# Backends.
+# ----------------------------------------------------------------------------#
+
+
+class MemoryBackend(object):
+    # in-process LRU with a TTL per entry. Tag versions are kept apart
+    # from the LRU so that evicting them can never resurrect stale pages
+    def __init__(self, max_entries=1024):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._counters = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires = entry
+            if expires < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl):
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def counter(self, key):
+        return self._counters.get(key, 0)
+
+    def incr(self, key):
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + 1
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class RedisBackend(object):
+    # shared between workers, for a local Redis-compatible server
+    def __init__(self, url, prefix='fyyur:'):
+        # optional dependency, only needed with CACHE_BACKEND = 'redis'
+        import redis
+        self.prefix = prefix
+        self._client = redis.Redis.from_url(url)
+
+    def get(self, key):
+        value = self._client.get(self.prefix + key)
+        return None if value is None else pickle.loads(value)
+
+    def set(self, key, value, ttl):
+        self._client.setex(self.prefix + key, int(ttl), pickle.dumps(value))
+
+    def counter(self, key):
+        return int(self._client.get(self.prefix + key) or 0)
+
+    def incr(self, key):
+        self._client.incr(self.prefix + key)
+
+    def __len__(self):
+        return self._client.dbsize()
+
+
+# ----------------------------------------------------------------------------#
+# Cache.
+# ----------------------------------------------------------------------------#
+
+
+class Cache(object):
+    # rendered pages and view data keyed per entity. Every key embeds the
+    # current version of its tags (e.g. 'venue:1', 'venues'), committing a
+    # change to a tagged model bumps the versions so stale entries are
+    # never read again and age out of the backend
+    def __init__(self, app=None):
+        self.backend = None
+        self.default_ttl = 60
+        self.hits = 0
+        self.misses = 0
+        self.listening = False
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.default_ttl = app.config.get('CACHE_DEFAULT_TTL', 60)
+        if app.config.get('CACHE_BACKEND', 'memory') == 'redis':
+            self.backend = RedisBackend(app.config['CACHE_REDIS_URL'])
+        else:
+            self.backend = MemoryBackend(
+                app.config.get('CACHE_MAX_ENTRIES', 1024))
+        app.extensions['cache'] = self
+        # the session events are global, one set of listeners serves the
+        # sessions of every app
+        if not self.listening:
+            listen_for_changes(self)
+            self.listening = True
+
+    def key(self, name, tags):
+        # '*' is bumped by bulk statements that touch unknown rows
+        versions = ','.join('%s=%d' % (tag, self.backend.counter(
+            'tag:' + tag)) for tag in chain(['*'], tags))
+        return '%s[%s]' % (name, versions)
+
+    def get(self, key):
+        value = self.backend.get(key)
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    def set(self, key, value, ttl=None):
+        self.backend.set(key, value, ttl or self.default_ttl)
+
+    def cached(self, name, tags, builder, ttl=None):
+        # to get view data from the cache or build and store it
+        key = self.key(name, tags)
+        value = self.get(key)
+        if value is None:
+            value = builder()
+            self.set(key, value, ttl)
+        return value
+
+    def invalidate(self, *tags):
+        for tag in tags:
+            self.backend.incr('tag:' + tag)
+
+    def stats(self):
+        return {
+            'backend': type(self.backend).__name__,
+            'entries': len(self.backend),
+            'hits': self.hits,
+            'misses': self.misses
+        }
+
+
+cache = Cache()
+
+
+class Snapshot(object):
+    # view data kept in process memory and served without a round trip.
+    # It is rebuilt on the first read after one of its tags was
+    # invalidated by a committed write, or once it is older than max_age
+    def __init__(self, name, tags, builder, max_age=30):
+        self.name = name
+        self.tags = tags
+        self.builder = builder
+        self.max_age = max_age
+        self._value = None
+        self._key = None
+        self._built_at = 0
+        self._lock = threading.Lock()
+
+    def fresh(self, key):
+        return self._key == key and \
+            time.monotonic() - self._built_at < self.max_age
+
+    def get(self):
+        key = cache.key(self.name, self.tags)
+        if self.fresh(key):
+            return self._value
+        with self._lock:
+            # to build once when several requests find it stale
+            if not self.fresh(key):
+                started = time.monotonic()
+                self._value = self.builder()
+                self._key = key
+                self._built_at = time.monotonic()
+                current_app.logger.debug(
+                    'snapshot %s rebuilt in %.1fms', self.name,
+                    (self._built_at - started) * 1000,
+                    extra={'snapshot': self.name, 'tags': self.tags})
+        return self._value
+
+
+def cached_page(*tags):
+    # caches the page rendered by a GET view per path and query string.
+    # Tags are formatted with the view arguments, e.g. 'venue:{venue_id}'.
+    # Pages that render flashed messages are never cached
+    def decorator(view):
+        @wraps(view)
+        def wrapper(**kwargs):
+            key, page = cached_lookup([tag.format(**kwargs) for tag in tags])
+            if page is None:
+                page = view(**kwargs)
+                cache_page(key, page)
+            return page
+        return wrapper
+    return decorator
+
+
+def renders_flashes():
+    # pages showing flashed messages are neither cached nor validated
+    return bool(session.get('_flashes'))
+
+
+def cached_lookup(tags):
+    # the cache key of the page at the current path and the cached page,
+    # (None, None) when the page must not be cached
+    if renders_flashes():
+        return None, None
+    key = cache.key('page:' + request.full_path, tags)
+    return key, cache.get(key)
+
+
+def cache_page(key, page):
+    # stores what a view rendered, not its responses and redirects, nor a
+    # page that flashed a message while rendering
+    if key is not None and isinstance(page, str) and \
+            not get_flashed_messages():
+        cache.set(key, page)
+
+
+def cached_stream(name, tags, generate, ttl=None, max_size=1024 * 1024):
+    # yields the chunks of a streamed body from the cache, or from
+    # generate() while keeping a copy that is stored once the stream is
+    # complete. Bodies over max_size are streamed without being cached
+    key = cache.key(name, tags)
+    body = cache.get(key)
+    if body is not None:
+        yield body
+        return
+    chunks = []
+    size = 0
+    for chunk in generate():
+        if chunks is not None:
+            size += len(chunk)
+            if size > max_size:
+                chunks = None
+            else:
+                chunks.append(chunk)
+        yield chunk
+    if chunks is not None:
+        cache.set(key, ''.join(chunks), ttl)
+
+
+# ----------------------------------------------------------------------------#
+# Conditional GET.
+# ----------------------------------------------------------------------------#
+
+
+def not_modified(etag, last_modified):
+    # If-None-Match takes precedence over If-Modified-Since
+    if request.if_none_match:
+        return request.if_none_match.contains(etag)
+    if request.if_modified_since and last_modified is not None:
+        return last_modified <= request.if_modified_since
+    return False
+
+
+def conditional_page(validator):
+    # strong ETag and Last-Modified for a GET view. validator(**kwargs)
+    # returns the (version, last_modified) of what the page renders from,
+    # last_modified None when no timestamp moves with every change, or
+    # None to leave the request to the view (e.g. for a 404). Clients
+    # holding the current version get a 304 before the view runs
+    def decorator(view):
+        @wraps(view)
+        def wrapper(**kwargs):
+            state = None if renders_flashes() else validator(**kwargs)
+            if state is None:
+                return view(**kwargs)
+            etag, last_modified = page_validators(*state)
+            response = not_modified_response(etag, last_modified) or \
+                make_response(view(**kwargs))
+            return revalidated(response, etag, last_modified)
+        return wrapper
+    return decorator
+
+
+def not_modified_response(etag, last_modified):
+    # the 304 for a client holding the current version, else None
+    if not_modified(etag, last_modified):
+        return current_app.response_class(status=304)
+    return None
+
+
+def page_validators(version, last_modified):
+    # the ETag and Last-Modified of the page at the current path
+    etag = hashlib.sha1(repr((
+        request.full_path, version,
+        current_app.config.get('ETAG_SALT', ''))
+    ).encode()).hexdigest()
+    if last_modified is not None:
+        last_modified = last_modified.replace(
+            microsecond=0, tzinfo=timezone.utc)
+    return etag, last_modified
+
+
+def revalidated(response, etag, last_modified):
+    response.set_etag(etag)
+    # werkzeug dates a None last_modified now
+    if last_modified is not None:
+        response.last_modified = last_modified
+    # to make browsers and the CDN revalidate on every use
+    response.cache_control.no_cache = True
+    return response
+
+
+# ----------------------------------------------------------------------------#
+# Invalidation.
+# ----------------------------------------------------------------------------#
+
+
+def previous_values(instance, attribute):
+    # values an attribute had before the pending change
+    return inspect(instance).attrs[attribute].history.deleted or []
+
+
+def tags_for(instance):
+    if isinstance(instance, Venue):
+        return ['venues', 'venue:%s' % instance.id]
+    if isinstance(instance, Artist):
+        return ['artists', 'artist:%s' % instance.id]
+    if isinstance(instance, Show):
+        venue_ids = [instance.venue_id] + previous_values(
+            instance, 'venue_id')
+        artist_ids = [instance.artist_id] + previous_values(
+            instance, 'artist_id')
+        return ['shows'] + ['venue:%s' % venue_id for venue_id in venue_ids] \
+            + ['artist:%s' % artist_id for artist_id in artist_ids]
+    return []
+
+
+def listen_for_changes(cache):
+    # tags touched by a flush are collected on the session and only
+    # invalidated once the transaction commits
+    def pending_tags(session):
+        return session.info.setdefault('cache_tags', set())
+
+    @event.listens_for(Session, 'after_flush')
+    def after_flush(session, flush_context):
+        # new instances have their ids by now and dirty ones still
+        # carry their attribute history
+        for instance in chain(session.new, session.dirty, session.deleted):
+            pending_tags(session).update(tags_for(instance))
+
+    @event.listens_for(Session, 'after_bulk_update')
+    @event.listens_for(Session, 'after_bulk_delete')
+    def after_bulk(context):
+        pending_tags(context.session).add('*')
+
+    @event.listens_for(Session, 'after_commit')
+    def after_commit(session):
+        cache.invalidate(*session.info.pop('cache_tags', ()))
+
+    @event.listens_for(Session, 'after_soft_rollback')
+    def after_soft_rollback(session, previous_transaction):
+        session.info.pop('cache_tags', None)
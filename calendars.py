@@ -0,0 +1,101 @@
+# ----------------------------------------------------------------------------#
+# Imports
+# ----------------------------------------------------------------------------#
+
+import io
+from urllib.parse import urlsplit
+from flask import current_app
+from models import db, Venue, Artist, Show
+
+
+# ----------------------------------------------------------------------------#
+# iCalendar.
+# ----------------------------------------------------------------------------#
+
+
+# start and end times are stored without a time zone, they are written
+# as floating times, the local time of the venue
+FLOATING_FORMAT = '%Y%m%dT%H%M%S'
+UTC_FORMAT = '%Y%m%dT%H%M%SZ'
+
+
+def escape(text):
+    # TEXT values (RFC 5545 3.3.11)
+    return (text or '').replace('\\', '\\\\').replace(';', '\\;').replace(
+        ',', '\\,').replace('\r\n', '\\n').replace('\n', '\\n')
+
+
+def fold(line):
+    # content lines longer than 75 octets are continued on lines starting
+    # with a space, without splitting a UTF-8 sequence
+    encoded = line.encode()
+    if len(encoded) <= 75:
+        return line + '\r\n'
+    parts = []
+    limit = 75
+    while encoded:
+        cut = min(limit, len(encoded))
+        while cut < len(encoded) and (encoded[cut] & 0xC0) == 0x80:
+            cut -= 1
+        parts.append(encoded[:cut].decode())
+        encoded = encoded[cut:]
+        limit = 74
+    return '\r\n '.join(parts) + '\r\n'
+
+
+def event_lines(show, base_url):
+    return [
+        'BEGIN:VEVENT',
+        'UID:show-%d@%s' % (show.id, urlsplit(base_url).hostname),
+        'DTSTAMP:' + show.updated_at.strftime(UTC_FORMAT),
+        'DTSTART:' + show.start_time.strftime(FLOATING_FORMAT),
+        'DTEND:' + show.end_time.strftime(FLOATING_FORMAT),
+        'SUMMARY:' + escape('%s at %s' % (show.artist_name,
+                                          show.venue_name)),
+        'LOCATION:' + escape('%s, %s, %s' % (
+            show.address, show.city, show.state)),
+        'URL:%sartists/%d' % (base_url, show.artist_id),
+        'END:VEVENT'
+    ]
+
+
+def calendar_rows(model, entity_id, name, base_url, engine=None,
+                  batch_size=None):
+    # yields the iCalendar feed of the shows of a venue or an artist, a
+    # batch of events at a time, read through a server side cursor so
+    # memory stays flat whatever the number of shows
+    engine = engine or db.engine
+    batch_size = batch_size or current_app.config.get(
+        'EXPORT_BATCH_SIZE', 2000)
+    foreign_key = Show.venue_id if model is Venue else Show.artist_id
+    query = db.select(
+        Show.id,
+        Show.artist_id,
+        Show.start_time,
+        Show.end_time.label('end_time'),
+        Show.updated_at,
+        Artist.name.label('artist_name'),
+        Venue.name.label('venue_name'),
+        Venue.address,
+        Venue.city,
+        Venue.state
+    ).join(Venue, Venue.id == Show.venue_id).join(
+        Artist, Artist.id == Show.artist_id).filter(
+        foreign_key == entity_id).order_by(
+        Show.start_time, Show.id).execution_options(
+        stream_results=True, yield_per=batch_size)
+    out = io.StringIO()
+    for line in ['BEGIN:VCALENDAR', 'VERSION:2.0',
+                 'PRODID:-//Fyyur//Shows//EN', 'CALSCALE:GREGORIAN',
+                 'X-WR-CALNAME:' + escape('%s shows' % name)]:
+        out.write(fold(line))
+    with engine.connect() as connection:
+        for rows in connection.execute(query).partitions():
+            for row in rows:
+                for line in event_lines(row, base_url):
+                    out.write(fold(line))
+            yield out.getvalue()
+            out.seek(0)
+            out.truncate()
+    out.write(fold('END:VCALENDAR'))
+    yield out.getvalue()
@@ -0,0 +1,117 @@
+# ----------------------------------------------------------------------------#
+# Imports
+# ----------------------------------------------------------------------------#
+
+import csv
+import io
+import json
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from models import db, Venue, Artist, Show
+
+
+# ----------------------------------------------------------------------------#
+# Columns.
+# ----------------------------------------------------------------------------#
+
+
+# kind: (model, columns labelled with the field names of the forms so an
+# export can be read back by the import)
+KINDS = {
+    'venues': (Venue, [
+        Venue.id, Venue.name, Venue.city, Venue.state, Venue.address,
+        Venue.phone, Venue.genres, Venue.image_link, Venue.facebook_link,
+        Venue.website.label('website_link'), Venue.seeking_talent,
+        Venue.seeking_description
+    ]),
+    'artists': (Artist, [
+        Artist.id, Artist.name, Artist.city, Artist.state, Artist.phone,
+        Artist.genres, Artist.image_link, Artist.facebook_link,
+        Artist.website.label('website_link'), Artist.seeking_venue,
+        Artist.seeking_description
+    ]),
+    'shows': (Show, [
+        Show.id, Show.artist_id, Show.venue_id, Show.start_time,
+        # in whole seconds, as the import reads it back. Floored so a
+        # re-imported show never ends later and overlaps the next booking
+        db.cast(db.func.floor(db.extract('epoch', Show.duration)),
+                db.Integer).label('duration_seconds')
+    ])
+}
+
+FORMATS = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson'
+}
+
+# the format ShowForm parses start times with
+DATETIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+
+def csv_value(value):
+    if isinstance(value, list):
+        return ';'.join(value)
+    if isinstance(value, bool):
+        return 'true' if value else 'false'
+    if hasattr(value, 'strftime'):
+        return value.strftime(DATETIME_FORMAT)
+    return value
+
+
+def json_value(value):
+    return value.strftime(DATETIME_FORMAT)
+
+
+# ----------------------------------------------------------------------------#
+# Export.
+# ----------------------------------------------------------------------------#
+
+
+def export_rows(kind, format, engine=None, batch_size=None):
+    # yields the table as CSV or NDJSON text, a batch of rows at a time.
+    # Rows are read in id order through a server side cursor so memory
+    # stays flat whatever the size of the table
+    model, columns = KINDS[kind]
+    if format not in FORMATS:
+        raise ValueError('unknown format %r' % format)
+    engine = engine or db.engine
+    batch_size = batch_size or current_app.config.get(
+        'EXPORT_BATCH_SIZE', 2000)
+    query = db.select(*columns).order_by(model.id).execution_options(
+        stream_results=True, yield_per=batch_size)
+    names = [column.key for column in columns]
+    with engine.connect() as connection:
+        result = connection.execute(query)
+        out = io.StringIO()
+        if format == 'csv':
+            writer = csv.writer(out)
+            writer.writerow(names)
+        for rows in result.partitions():
+            if format == 'csv':
+                writer.writerows([csv_value(value) for value in row]
+                                 for row in rows)
+            else:
+                for row in rows:
+                    out.write(json.dumps(dict(zip(names, row)),
+                                         default=json_value))
+                    out.write('\n')
+            yield out.getvalue()
+            out.seek(0)
+            out.truncate()
+        if format == 'csv' and out.tell():
+            # the header of an empty table
+            yield out.getvalue()
+
+
+@click.command('export')
+@click.argument('kind', type=click.Choice(sorted(KINDS)))
+@click.option('--format', 'format', type=click.Choice(sorted(FORMATS)),
+              default='csv', show_default=True)
+@click.option('--output', '-o', type=click.File('w', encoding='utf-8'),
+              default='-', help='Defaults to stdout.')
+@with_appcontext
+def export_command(kind, format, output):
+    """Export venues, artists or shows as CSV or NDJSON."""
+    for text in export_rows(kind, format):
+        output.write(text)
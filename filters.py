@@ -0,0 +1,41 @@
+# ----------------------------------------------------------------------------#
+# Imports
+# ----------------------------------------------------------------------------#
+
+from datetime import datetime
+from functools import lru_cache
+import babel.dates
+import dateutil.parser
+
+
+# ----------------------------------------------------------------------------#
+# Datetime formatting.
+# ----------------------------------------------------------------------------#
+
+# named formats accepted by the datetime filter
+FORMATS = {
+    'full': "EEEE MMMM, d, y 'at' h:mma",
+    'medium': "EE MM, dd, y h:mma"
+}
+
+
+@lru_cache(maxsize=64)
+def compiled_pattern(format, locale):
+    # Babel pattern and locale compiled once per (format, locale)
+    return (babel.dates.parse_pattern(FORMATS.get(format, format)),
+            babel.Locale.parse(locale))
+
+
+@lru_cache(maxsize=4096)
+def render_datetime(value, format, locale):
+    # rendered strings memoized per (datetime, format, locale), shows
+    # share a small set of start times across the listing pages
+    pattern, locale = compiled_pattern(format, locale)
+    return pattern.apply(value, locale)
+
+
+def format_datetime(value, format='medium', locale='en'):
+    # accepts datetime objects directly, strings are still parsed
+    if not isinstance(value, datetime):
+        value = dateutil.parser.parse(value)
+    return render_datetime(value, format, locale)
@@ -0,0 +1,85 @@
+# ----------------------------------------------------------------------------#
+# Gunicorn settings: gunicorn -c gunicorn.conf.py wsgi:app
+#
+# WEB_CONCURRENCY worker processes of WEB_THREADS threads each (config.py),
+# each worker with a database pool sized from its threads. The app is
+# loaded once in the master and shared with the workers copy-on-write.
+#
+# Restarts: HUP starts new workers and stops the old ones once their
+# requests are done (within GRACEFUL_TIMEOUT). Since the code is loaded in
+# the master, a release needs a new master: USR2 starts one next to the
+# old, then QUIT the old master. Workers are also replaced after about
+# MAX_REQUESTS requests to bound the growth of their memory.
+# ----------------------------------------------------------------------------#
+
+import glob
+import os
+import random
+import tempfile
+
+# one metrics directory per master, shared by its workers
+os.environ.setdefault('METRICS_DIR', os.path.join(
+    tempfile.gettempdir(), 'fyyur-metrics-%d' % os.getpid()))
+
+import config as settings
+
+bind = os.environ.get('BIND', '0.0.0.0:%s' % os.environ.get('PORT', 8000))
+workers = settings.WEB_WORKERS
+threads = settings.WEB_THREADS
+# gthread keeps idle keep-alive connections out of the worker threads, set
+# to uvicorn_worker.UvicornWorker with asgi:application for the async mode
+worker_class = os.environ.get('WEB_WORKER_CLASS', 'gthread')
+preload_app = True
+timeout = int(os.environ.get('WEB_TIMEOUT', 30))
+graceful_timeout = int(os.environ.get('GRACEFUL_TIMEOUT', 30))
+keepalive = int(os.environ.get('WEB_KEEPALIVE', 5))
+max_requests = int(os.environ.get('MAX_REQUESTS', 10000))
+max_requests_jitter = max_requests // 10
+accesslog = '-'
+errorlog = '-'
+
+
+def on_starting(server):
+    # the database must accept every pool at its fullest
+    options = settings.SQLALCHEMY_ENGINE_OPTIONS
+    needed = workers * (options['pool_size'] + options['max_overflow'])
+    if settings.DB_MAX_CONNECTIONS and needed > settings.DB_MAX_CONNECTIONS:
+        raise SystemExit(
+            '%d workers with pools of %d + %d overflow need %d connections, '
+            'DB_MAX_CONNECTIONS is %d' % (
+                workers, options['pool_size'], options['max_overflow'],
+                needed, settings.DB_MAX_CONNECTIONS))
+    # each worker would sign the session cookie with a key of its own
+    if not os.environ.get('SECRET_KEY'):
+        raise SystemExit('SECRET_KEY is not set, every worker and release '
+                         'must sign the session cookie with the same key')
+    # counters of a previous server would be added to the new ones
+    for path in glob.glob(os.path.join(settings.METRICS_DIR, '*.json')):
+        os.remove(path)
+    if settings.DEBUG:
+        server.log.warning('DEBUG is on, set FLASK_DEBUG=0 in production')
+
+
+def post_fork(server, worker):
+    # connections opened by the master while loading the app belong to it,
+    # each worker starts with empty pools of its own. The replica choice
+    # must not repeat across workers
+    from app import app
+    from models import db
+    with app.app_context():
+        for bind in [None] + list(app.config['SQLALCHEMY_BINDS'] or {}):
+            db.get_engine(app, bind).dispose(close=False)
+    random.seed()
+
+
+def worker_exit(server, worker):
+    # the counts since the last flush, for child_exit to archive
+    from metrics import registry
+    registry.flush(force=True)
+
+
+def child_exit(server, worker):
+    # runs in the master once the worker is gone, before a new worker can
+    # take its pid
+    from metrics import registry
+    registry.archive(worker.pid)
@@ -0,0 +1,267 @@
+# ----------------------------------------------------------------------------#
+# Imports
+# ----------------------------------------------------------------------------#
+
+import csv
+import io
+import json
+import re
+import time
+from datetime import timedelta
+from itertools import islice
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from werkzeug.datastructures import MultiDict
+from cache import cache
+from forms import VenueForm, ArtistForm, ShowImportForm
+from models import db, Venue, Artist, Show, show_constraint_error
+from replicas import mark_written
+
+
+# ----------------------------------------------------------------------------#
+# Rows.
+# ----------------------------------------------------------------------------#
+
+
+def venue_row(data):
+    return {
+        'name': data['name'],
+        'city': data['city'],
+        'state': data['state'],
+        'address': data['address'],
+        'phone': data['phone'],
+        'image_link': data['image_link'],
+        'facebook_link': data['facebook_link'],
+        'seeking_talent': data['seeking_talent'],
+        'seeking_description': data['seeking_description'],
+        'website': data['website_link'],
+        'genres': data['genres']
+    }
+
+
+def artist_row(data):
+    return {
+        'name': data['name'],
+        'city': data['city'],
+        'state': data['state'],
+        'phone': data['phone'],
+        'image_link': data['image_link'],
+        'facebook_link': data['facebook_link'],
+        'seeking_venue': data['seeking_venue'],
+        'seeking_description': data['seeking_description'],
+        'website': data['website_link'],
+        'genres': data['genres']
+    }
+
+
+def show_row(data):
+    return {
+        'artist_id': int(data['artist_id']),
+        'venue_id': int(data['venue_id']),
+        'start_time': data['start_time'],
+        'duration': timedelta(minutes=data['duration'])
+        if data['duration_seconds'] is None
+        else timedelta(seconds=data['duration_seconds'])
+    }
+
+
+# kind: (form validating a row, model, row builder, fields the form
+# does not require on its own)
+KINDS = {
+    'venues': (VenueForm, Venue, venue_row, ()),
+    'artists': (ArtistForm, Artist, artist_row, ()),
+    'shows': (ShowImportForm, Show, show_row,
+              ('artist_id', 'venue_id', 'start_time'))
+}
+
+
+# ----------------------------------------------------------------------------#
+# Reading.
+# ----------------------------------------------------------------------------#
+
+
+def read_records(stream, format):
+    # yields (line number, record) from a CSV file with a header row or
+    # from JSON lines, genres are separated by ';' or ',' in CSV cells
+    if format == 'csv':
+        reader = csv.DictReader(stream)
+        for record in reader:
+            yield reader.line_num, record
+    elif format in ('jsonl', 'ndjson'):
+        for line_num, line in enumerate(stream, 1):
+            if line.strip():
+                try:
+                    yield line_num, json.loads(line)
+                except ValueError:
+                    yield line_num, None
+    else:
+        raise ValueError('unknown format %r' % format)
+
+
+def form_data(record):
+    # to feed a record to a form like a submitted request would
+    data = MultiDict()
+    for key, value in record.items():
+        if value is None:
+            continue
+        if key == 'genres' and isinstance(value, str):
+            value = [genre.strip() for genre in re.split('[;,]', value)
+                     if genre.strip()]
+        if isinstance(value, list):
+            for item in value:
+                data.add(key, item)
+        else:
+            data.add(key, value)
+    return data
+
+
+# ----------------------------------------------------------------------------#
+# Import.
+# ----------------------------------------------------------------------------#
+
+
+class Importer(object):
+    # validates records with the form of their kind and inserts the valid
+    # ones with a multi-row INSERT per chunk, each chunk in a transaction
+    def __init__(self, kind, chunk_size=1000):
+        self.form_class, self.model, self.build_row, self.required = \
+            KINDS[kind]
+        self.kind = kind
+        self.chunk_size = chunk_size
+        # one form reused for every record, processed again per row
+        self.form = self.form_class(formdata=None, meta={'csrf': False})
+        self.rows = 0
+        self.inserted = 0
+        self.errors = []
+
+    def validate(self, line_num, record):
+        # returns the row to insert or records why it can not be
+        if not isinstance(record, dict):
+            self.errors.append({'line': line_num,
+                                'errors': {'record': ['Invalid record.']}})
+            return None
+        errors = {field: ['This field is required.']
+                  for field in self.required if not record.get(field)}
+        self.form.process(form_data(record))
+        if self.form.validate() and not errors:
+            try:
+                return self.build_row(self.form.data)
+            except (TypeError, ValueError) as error:
+                errors = {'record': [str(error)]}
+        errors.update(self.form.errors)
+        self.errors.append({'line': line_num, 'errors': errors})
+        return None
+
+    def check_references(self, lines, rows):
+        # drops shows whose venue or artist does not exist, one query per
+        # referenced table and chunk
+        for column, model in (('venue_id', Venue), ('artist_id', Artist)):
+            ids = list({row[column] for row in rows if row is not None})
+            existing = {row.id for row in db.session.query(model.id).filter(
+                model.id.in_(ids))}
+            for index, row in enumerate(rows):
+                if row is not None and row[column] not in existing:
+                    self.errors.append({'line': lines[index], 'errors': {
+                        column: ['No %s with id %d.' % (
+                            model.__tablename__, row[column])]}})
+                    rows[index] = None
+
+    def insert(self, lines, rows):
+        table = self.model.__table__
+        try:
+            with db.engine.begin() as connection:
+                connection.execute(table.insert(), rows)
+            self.inserted += len(rows)
+        except Exception:
+            # to find the failing rows, one transaction each
+            for line_num, row in zip(lines, rows):
+                try:
+                    with db.engine.begin() as connection:
+                        connection.execute(table.insert(), row)
+                    self.inserted += 1
+                except Exception as error:
+                    field, message = show_constraint_error(error) or (
+                        'record', str(getattr(error, 'orig', error)))
+                    self.errors.append({'line': line_num, 'errors': {
+                        field: [message]}})
+
+    def run(self, records):
+        started = time.perf_counter()
+        records = iter(records)
+        try:
+            while True:
+                chunk = list(islice(records, self.chunk_size))
+                if not chunk:
+                    break
+                self.rows += len(chunk)
+                lines = [line_num for line_num, record in chunk]
+                rows = [self.validate(line_num, record)
+                        for line_num, record in chunk]
+                if self.model is Show and any(rows):
+                    self.check_references(lines, rows)
+                valid = [(line_num, row) for line_num, row
+                         in zip(lines, rows) if row is not None]
+                if valid:
+                    self.insert(*map(list, zip(*valid)))
+        finally:
+            db.session.remove()
+            if self.inserted:
+                # rows inserted outside of the ORM, no session events fired
+                cache.invalidate('*')
+                mark_written(current_app)
+        seconds = time.perf_counter() - started
+        self.errors.sort(key=lambda error: error['line'])
+        return {
+            'kind': self.kind,
+            'rows': self.rows,
+            'inserted': self.inserted,
+            'failed': len(self.errors),
+            'errors': self.errors[:current_app.config.get(
+                'IMPORT_MAX_REPORTED_ERRORS', 1000)],
+            'seconds': round(seconds, 3),
+            'rows_per_second': round(self.rows / seconds) if seconds else 0
+        }
+
+
+def import_stream(kind, stream, format, chunk_size=None):
+    # imports a text stream of CSV or JSON lines, returns the report
+    chunk_size = chunk_size or current_app.config.get(
+        'IMPORT_CHUNK_SIZE', 1000)
+    return Importer(kind, chunk_size).run(read_records(stream, format))
+
+
+def format_for(filename, default='csv'):
+    if filename.endswith(('.jsonl', '.ndjson')):
+        return 'jsonl'
+    if filename.endswith('.csv'):
+        return 'csv'
+    return default
+
+
+@click.command('import')
+@click.argument('kind', type=click.Choice(sorted(KINDS)))
+@click.argument('path', type=click.Path(exists=True, allow_dash=True))
+@click.option('--format', 'format',
+              type=click.Choice(['csv', 'jsonl', 'ndjson']),
+              help='Defaults to the file extension, then csv.')
+@click.option('--chunk-size', type=int, help='Rows per transaction.')
+@with_appcontext
+def import_command(kind, path, format, chunk_size):
+    """Import venues, artists or shows from a CSV or JSON lines file."""
+    format = format or format_for(path)
+    if path == '-':
+        stream = io.TextIOWrapper(click.get_binary_stream('stdin'),
+                                  encoding='utf-8', newline='')
+    else:
+        stream = open(path, encoding='utf-8', newline='')
+    with stream:
+        report = import_stream(kind, stream, format, chunk_size)
+    for error in report['errors']:
+        click.echo('line %d: %s' % (error['line'], json.dumps(
+            error['errors'])), err=True)
+    click.echo('%(kind)s: %(inserted)d of %(rows)d rows imported, '
+               '%(failed)d failed, %(seconds).2fs '
+               '(%(rows_per_second)d rows/s)' % report)
+    if report['failed']:
+        raise SystemExit(1)
@@ -0,0 +1,381 @@
+# ----------------------------------------------------------------------------#
+# Imports
+# ----------------------------------------------------------------------------#
+
+import fcntl
+import json
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+from bisect import bisect_left
+from contextlib import contextmanager
+from flask import (
+    current_app,
+    g,
+    has_app_context,
+    has_request_context,
+    request
+)
+from jinja2 import Template
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+request_log = logging.getLogger('fyyur.requests')
+query_log = logging.getLogger('fyyur.slow_queries')
+
+
+# ----------------------------------------------------------------------------#
+# Registry.
+# ----------------------------------------------------------------------------#
+
+
+# upper bounds in seconds of the request duration histogram
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+# name, type and help of every metric, in the order /metrics lists them
+METRICS = [
+    ('fyyur_requests_total', 'counter',
+     'Requests by endpoint, method and status.'),
+    ('fyyur_request_duration_seconds', 'histogram',
+     'Wall time of the requests by endpoint.'),
+    ('fyyur_request_db_seconds_total', 'counter',
+     'Time spent in database statements by endpoint.'),
+    ('fyyur_request_queries_total', 'counter',
+     'Database statements by endpoint.'),
+    ('fyyur_request_template_seconds_total', 'counter',
+     'Time spent rendering templates by endpoint.'),
+    ('fyyur_slow_queries_total', 'counter',
+     'Statements slower than SLOW_QUERY_MS by endpoint.'),
+]
+
+
+class Registry(object):
+    # counters and histograms of this process. With METRICS_DIR set each
+    # worker writes them there at most once a second and /metrics adds up
+    # the files of every worker. The gunicorn master folds the file of an
+    # exited worker into the archive so the totals never go down
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters = {}
+        self.histograms = {}
+        self.directory = None
+        self.flushed_at = 0
+        self.listening = False
+
+    def inc(self, name, labels, value=1):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, labels, value):
+        # one count per bucket, then +Inf, then the sum
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            counts = self.histograms.setdefault(
+                key, [0] * (len(BUCKETS) + 1) + [0.0])
+            counts[bisect_left(BUCKETS, value)] += 1
+            counts[-1] += value
+
+    def state(self):
+        with self.lock:
+            return {
+                'counters': [[name, labels, value] for (name, labels), value
+                             in self.counters.items()],
+                'histograms': [[name, labels, counts] for (name, labels),
+                               counts in self.histograms.items()]
+            }
+
+    def flush(self, force=False):
+        if self.directory is None:
+            return
+        now = time.monotonic()
+        if not force and now < self.flushed_at + 1:
+            return
+        self.flushed_at = now
+        path = os.path.join(self.directory, '%d.json' % os.getpid())
+        with open(path + '.tmp', 'w') as file:
+            json.dump(self.state(), file)
+        os.replace(path + '.tmp', path)
+
+    def collect(self):
+        # the states of every worker and the archive, or of this process
+        # alone
+        if self.directory is None:
+            return [self.state()]
+        self.flush(force=True)
+        states = []
+        with self.locked(fcntl.LOCK_SH):
+            for name in os.listdir(self.directory):
+                if not name.endswith('.json'):
+                    continue
+                state = read_state(os.path.join(self.directory, name))
+                if state is not None:
+                    states.append(state)
+        return states
+
+    def archive(self, pid):
+        # adds the last state of an exited worker to archive.json and
+        # removes its file, under the lock so a collect sees it once
+        if self.directory is None:
+            return
+        path = os.path.join(self.directory, '%d.json' % pid)
+        archive = os.path.join(self.directory, 'archive.json')
+        with self.locked(fcntl.LOCK_EX):
+            state = read_state(path)
+            if state is None:
+                return
+            counters, histograms = merge(filter(None, [
+                read_state(archive), state]))
+            with open(archive + '.tmp', 'w') as file:
+                json.dump({
+                    'counters': [[name, labels, value] for (name, labels),
+                                 value in counters.items()],
+                    'histograms': [[name, labels, counts] for (name, labels),
+                                   counts in histograms.items()]
+                }, file)
+            os.replace(archive + '.tmp', archive)
+            os.remove(path)
+
+    @contextmanager
+    def locked(self, operation):
+        # a flock on the directory, released when the file is closed
+        with open(os.path.join(self.directory, '.lock'), 'a') as file:
+            fcntl.flock(file, operation)
+            yield
+
+
+def read_state(path):
+    try:
+        with open(path) as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return None
+
+
+registry = Registry()
+
+
+def merge(states):
+    # the counters and histograms of several states added up
+    counters = {}
+    histograms = {}
+    for state in states:
+        for name, labels, value in state['counters']:
+            key = (name, tuple(map(tuple, labels)))
+            counters[key] = counters.get(key, 0) + value
+        for name, labels, counts in state['histograms']:
+            key = (name, tuple(map(tuple, labels)))
+            total = histograms.setdefault(key, [0] * len(counts))
+            for index, count in enumerate(counts):
+                total[index] += count
+    return counters, histograms
+
+
+def exposition():
+    # the Prometheus text format of the metrics of every worker
+    counters, histograms = merge(registry.collect())
+    lines = []
+    for name, kind, description in METRICS:
+        lines.append('# HELP %s %s' % (name, description))
+        lines.append('# TYPE %s %s' % (name, kind))
+        for (metric, labels), value in sorted(counters.items()):
+            if metric == name:
+                lines.append('%s%s %s' % (name, format_labels(labels),
+                                          format_value(value)))
+        for (metric, labels), counts in sorted(histograms.items()):
+            if metric != name:
+                continue
+            cumulative = 0
+            for bound, count in zip(BUCKETS + ('+Inf',), counts[:-1]):
+                cumulative += count
+                lines.append('%s_bucket%s %d' % (name, format_labels(
+                    labels + (('le', str(bound)),)), cumulative))
+            lines.append('%s_sum%s %s' % (name, format_labels(labels),
+                                          format_value(counts[-1])))
+            lines.append('%s_count%s %d' % (name, format_labels(labels),
+                                            cumulative))
+    return '\n'.join(lines) + '\n'
+
+
+def format_labels(labels):
+    if not labels:
+        return ''
+    return '{%s}' % ','.join('%s="%s"' % (name, str(value).replace(
+        '\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+        for name, value in labels)
+
+
+def format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+# ----------------------------------------------------------------------------#
+# Measurements.
+# ----------------------------------------------------------------------------#
+
+
+class TimedTemplate(Template):
+    # template class of the app's Jinja environment, times the renders of
+    # the request, includes and extends render inside the outer call
+    def render(self, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return Template.render(self, *args, **kwargs)
+        finally:
+            if has_request_context() and 'request_metrics' in g:
+                g.request_metrics['template_time'] += \
+                    time.perf_counter() - start
+
+
+def call_site():
+    # the innermost frame of the app's own code that issued the statement
+    for frame in reversed(traceback.extract_stack()):
+        if frame.filename.startswith(ROOT) and frame.filename != __file__ \
+                and 'site-packages' not in frame.filename:
+            return '%s:%d in %s' % (os.path.relpath(frame.filename, ROOT),
+                                    frame.lineno, frame.name)
+    return None
+
+
+def listen_for_queries():
+    # times every statement of every engine (replicas and the async mode
+    # included) for every app, a connection runs one statement at a time
+    @event.listens_for(Engine, 'before_cursor_execute')
+    def before_cursor_execute(connection, cursor, statement, parameters,
+                              context, executemany):
+        connection.info.setdefault('query_start', []).append(
+            time.perf_counter())
+
+    @event.listens_for(Engine, 'after_cursor_execute')
+    def after_cursor_execute(connection, cursor, statement, parameters,
+                             context, executemany):
+        elapsed = time.perf_counter() - connection.info['query_start'].pop()
+        in_request = has_request_context() and 'request_metrics' in g
+        if in_request:
+            g.request_metrics['db_time'] += elapsed
+            g.request_metrics['queries'] += 1
+        if not has_app_context() or \
+                elapsed * 1000 < current_app.config['SLOW_QUERY_MS']:
+            return
+        endpoint = request.endpoint if has_request_context() else None
+        if in_request:
+            g.request_metrics['slow_queries'] += 1
+            registry.inc('fyyur_slow_queries_total',
+                         {'endpoint': endpoint or 'unmatched'})
+        query_log.warning('slow query', extra={
+            'duration_ms': round(elapsed * 1000, 2),
+            'statement': statement,
+            'parameters': repr(parameters)[
+                :current_app.config['SLOW_QUERY_MAX_PARAMETERS_LENGTH']],
+            'executemany': executemany,
+            'call_site': call_site(),
+            'endpoint': endpoint
+        })
+
+    @event.listens_for(Engine, 'handle_error')
+    def handle_error(context):
+        if context.connection is not None and \
+                context.connection.info.get('query_start'):
+            context.connection.info['query_start'].pop()
+
+
+def start_request():
+    g.request_metrics = {
+        'start': time.perf_counter(),
+        'db_time': 0.0,
+        'queries': 0,
+        'slow_queries': 0,
+        'template_time': 0.0,
+        'status': None
+    }
+
+
+def record_status(response):
+    if 'request_metrics' in g:
+        g.request_metrics['status'] = response.status_code
+    return response
+
+
+def finish_request(error=None):
+    # runs once the response is sent, after the last chunk of a streamed
+    # one, so the statements of the stream are counted in
+    measured = g.pop('request_metrics', None)
+    if measured is None:
+        return
+    duration = time.perf_counter() - measured['start']
+    status = 500 if error is not None else measured['status'] or 500
+    endpoint = request.endpoint or 'unmatched'
+    labels = {'endpoint': endpoint}
+    registry.inc('fyyur_requests_total', dict(
+        labels, method=request.method, status=status))
+    registry.observe('fyyur_request_duration_seconds', labels, duration)
+    registry.inc('fyyur_request_db_seconds_total', labels,
+                 measured['db_time'])
+    registry.inc('fyyur_request_queries_total', labels, measured['queries'])
+    registry.inc('fyyur_request_template_seconds_total', labels,
+                 measured['template_time'])
+    registry.flush()
+    request_log.info('request', extra={
+        'method': request.method,
+        'path': request.full_path.rstrip('?'),
+        'endpoint': endpoint,
+        'status': status,
+        'duration_ms': round(duration * 1000, 2),
+        'db_ms': round(measured['db_time'] * 1000, 2),
+        'queries': measured['queries'],
+        'slow_queries': measured['slow_queries'],
+        'template_ms': round(measured['template_time'] * 1000, 2)
+    })
+
+
+# ----------------------------------------------------------------------------#
+# Logs.
+# ----------------------------------------------------------------------------#
+
+
+class JsonFormatter(logging.Formatter):
+    # one JSON object per line with the extra fields of the record
+    reserved = set(vars(logging.makeLogRecord({}))) | {'message', 'asctime'}
+
+    def format(self, record):
+        data = {
+            'time': self.formatTime(record),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage()
+        }
+        data.update((key, value) for key, value in vars(record).items()
+                    if key not in self.reserved)
+        if record.exc_info:
+            data['exception'] = self.formatException(record.exc_info)
+        return json.dumps(data, default=str)
+
+
+def init_metrics(app):
+    # request, statement and template timings, the request log and the
+    # slow query log. The template class must be set before the first
+    # template is loaded
+    registry.directory = app.config.get('METRICS_DIR') or None
+    if registry.directory:
+        os.makedirs(registry.directory, exist_ok=True)
+    app.jinja_env.template_class = TimedTemplate
+    app.before_request(start_request)
+    app.after_request(record_status)
+    app.teardown_request(finish_request)
+    # the engine events are global, one set of listeners for every app
+    if not registry.listening:
+        listen_for_queries()
+        registry.listening = True
+    handler = logging.StreamHandler(sys.stderr)
+    handler.setFormatter(JsonFormatter())
+    for logger, level in ((request_log, app.config['REQUEST_LOG_LEVEL']),
+                          (query_log, logging.WARNING)):
+        if not logger.handlers:
+            logger.addHandler(handler)
+        logger.setLevel(level)
+        logger.propagate = False
@@ -0,0 +1,28 @@
+"""add show indexes on venue/artist and start time
+
+Revision ID: 3f9a6c1e8b52
+Revises: 7c1d2b9e4f3a
+Create Date: 2022-06-21 09:40:12.530917
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3f9a6c1e8b52'
+down_revision = '7c1d2b9e4f3a'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_show_venue_id_start_time', 'show',
+                    ['venue_id', 'start_time'], unique=False)
+    op.create_index('ix_show_artist_id_start_time', 'show',
+                    ['artist_id', 'start_time'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_show_artist_id_start_time', table_name='show')
+    op.drop_index('ix_show_venue_id_start_time', table_name='show')
@@ -0,0 +1,30 @@
+"""add genre and state indexes on venue and artist
+
+Revision ID: 5e8c2d7a9f14
+Revises: b6e0f3d28a41
+Create Date: 2022-06-29 10:41:37.215804
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5e8c2d7a9f14'
+down_revision = 'b6e0f3d28a41'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    for table in ('venue', 'artist'):
+        op.create_index('ix_%s_genres' % table, table, ['genres'],
+                        unique=False, postgresql_using='gin')
+        op.create_index('ix_%s_state' % table, table, ['state'],
+                        unique=False)
+
+
+def downgrade():
+    for table in ('artist', 'venue'):
+        op.drop_index('ix_%s_state' % table, table_name=table)
+        op.drop_index('ix_%s_genres' % table, table_name=table)
@@ -0,0 +1,32 @@
+"""add trigram indexes on venue and artist names
+
+Revision ID: 7c1d2b9e4f3a
+Revises: e2a62214bb6c
+Create Date: 2022-06-20 10:12:31.418203
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7c1d2b9e4f3a'
+down_revision = 'e2a62214bb6c'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # pg_trgm lets the GIN indexes serve ILIKE '%term%' and similarity()
+    op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    op.create_index('ix_venue_name_trgm', 'venue', ['name'], unique=False,
+                    postgresql_using='gin',
+                    postgresql_ops={'name': 'gin_trgm_ops'})
+    op.create_index('ix_artist_name_trgm', 'artist', ['name'], unique=False,
+                    postgresql_using='gin',
+                    postgresql_ops={'name': 'gin_trgm_ops'})
+
+
+def downgrade():
+    op.drop_index('ix_artist_name_trgm', table_name='artist')
+    op.drop_index('ix_venue_name_trgm', table_name='venue')
@@ -0,0 +1,219 @@
+"""add the area table, maintained by triggers on venue and show
+
+Revision ID: 8a3f5c1d7e26
+Revises: 5e8c2d7a9f14
+Create Date: 2022-06-30 09:12:48.530917
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8a3f5c1d7e26'
+down_revision = '5e8c2d7a9f14'
+branch_labels = None
+depends_on = None
+
+
+# A show is upcoming when it starts after show_rollover.rolled_at, the
+# counters agree with that watermark and rollover_shows() moves it
+# forward. Every trigger holds the watermark row FOR SHARE and the
+# rollover FOR UPDATE, so a write and a rollover never both count a show
+FUNCTIONS = [
+    """
+    CREATE FUNCTION area_apply(states varchar[], cities varchar[],
+                               venues bigint[], shows bigint[])
+    RETURNS void AS $$
+        INSERT INTO area AS a (state, city, num_venues, num_upcoming_shows)
+        SELECT state, city, sum(venues)::integer, sum(shows)::integer
+        FROM unnest(states, cities, venues, shows)
+            AS d(state, city, venues, shows)
+        GROUP BY state, city
+        HAVING sum(venues) <> 0 OR sum(shows) <> 0
+        ORDER BY state, city
+        ON CONFLICT (state, city) DO UPDATE SET
+            num_venues = a.num_venues + excluded.num_venues,
+            num_upcoming_shows =
+                a.num_upcoming_shows + excluded.num_upcoming_shows;
+        DELETE FROM area a USING unnest(states, cities) AS d(state, city)
+        WHERE a.state = d.state AND a.city = d.city AND a.num_venues = 0;
+    $$ LANGUAGE sql
+    """,
+    """
+    CREATE FUNCTION area_apply_shows(venue_ids integer[], shows bigint[])
+    RETURNS void AS $$
+    BEGIN
+        -- to keep the venues from moving to another area meanwhile
+        PERFORM 1 FROM venue WHERE id = ANY(venue_ids)
+        ORDER BY id FOR SHARE;
+        PERFORM area_apply(array_agg(v.state), array_agg(v.city),
+                           array_agg(0::bigint), array_agg(d.shows))
+        FROM unnest(venue_ids, shows) AS d(venue_id, shows)
+        JOIN venue v ON v.id = d.venue_id;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+    """
+    CREATE FUNCTION area_venues_changed() RETURNS trigger AS $$
+    DECLARE
+        since timestamp;
+    BEGIN
+        SELECT rolled_at INTO since FROM show_rollover FOR SHARE;
+        IF TG_OP = 'INSERT' THEN
+            PERFORM area_apply(array_agg(state), array_agg(city),
+                               array_agg(1::bigint), array_agg(0::bigint))
+            FROM new_rows;
+        ELSIF TG_OP = 'DELETE' THEN
+            -- the shows of a venue are deleted before it
+            PERFORM area_apply(array_agg(state), array_agg(city),
+                               array_agg(-1::bigint), array_agg(0::bigint))
+            FROM old_rows;
+        ELSE
+            -- a venue changing area takes its upcoming shows along
+            PERFORM area_apply(array_agg(d.state), array_agg(d.city),
+                               array_agg(d.venues), array_agg(d.shows))
+            FROM old_rows o
+            JOIN new_rows n ON n.id = o.id
+            CROSS JOIN LATERAL (
+                SELECT count(*) AS upcoming FROM show s
+                WHERE s.venue_id = o.id AND s.start_time > since) u
+            CROSS JOIN LATERAL (VALUES
+                (o.state, o.city, -1::bigint, -u.upcoming),
+                (n.state, n.city, 1::bigint, u.upcoming)
+            ) AS d(state, city, venues, shows)
+            WHERE (o.state, o.city) IS DISTINCT FROM (n.state, n.city);
+        END IF;
+        RETURN NULL;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+    """
+    CREATE FUNCTION area_shows_changed() RETURNS trigger AS $$
+    DECLARE
+        since timestamp;
+    BEGIN
+        SELECT rolled_at INTO since FROM show_rollover FOR SHARE;
+        IF TG_OP = 'INSERT' THEN
+            PERFORM area_apply_shows(array_agg(venue_id),
+                                     array_agg(1::bigint))
+            FROM new_rows WHERE start_time > since;
+        ELSIF TG_OP = 'DELETE' THEN
+            PERFORM area_apply_shows(array_agg(venue_id),
+                                     array_agg(-1::bigint))
+            FROM old_rows WHERE start_time > since;
+        ELSE
+            PERFORM area_apply_shows(array_agg(venue_id), array_agg(shows))
+            FROM (
+                SELECT venue_id, -1::bigint FROM old_rows
+                WHERE start_time > since
+                UNION ALL
+                SELECT venue_id, 1::bigint FROM new_rows
+                WHERE start_time > since
+            ) AS d(venue_id, shows);
+        END IF;
+        RETURN NULL;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+    """
+    CREATE FUNCTION rollover_shows(until timestamp) RETURNS integer AS $$
+    DECLARE
+        since timestamp;
+        passed integer;
+    BEGIN
+        SELECT rolled_at INTO since FROM show_rollover FOR UPDATE;
+        IF until <= since THEN
+            RETURN 0;
+        END IF;
+        SELECT coalesce(sum(n), 0) INTO passed FROM (
+            SELECT count(*) AS n FROM show
+            WHERE start_time > since AND start_time <= until) AS d;
+        IF passed > 0 THEN
+            PERFORM area_apply_shows(array_agg(venue_id), array_agg(-n))
+            FROM (
+                SELECT venue_id, count(*) AS n FROM show
+                WHERE start_time > since AND start_time <= until
+                GROUP BY venue_id
+            ) AS d;
+        END IF;
+        UPDATE show_rollover SET rolled_at = until;
+        RETURN passed;
+    END
+    $$ LANGUAGE plpgsql
+    """
+]
+
+# transition tables need one trigger per event
+TRIGGERS = [
+    ('venue', 'INSERT', 'REFERENCING NEW TABLE AS new_rows',
+     'area_venues_changed'),
+    ('venue', 'UPDATE',
+     'REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows',
+     'area_venues_changed'),
+    ('venue', 'DELETE', 'REFERENCING OLD TABLE AS old_rows',
+     'area_venues_changed'),
+    ('show', 'INSERT', 'REFERENCING NEW TABLE AS new_rows',
+     'area_shows_changed'),
+    ('show', 'UPDATE',
+     'REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows',
+     'area_shows_changed'),
+    ('show', 'DELETE', 'REFERENCING OLD TABLE AS old_rows',
+     'area_shows_changed'),
+]
+
+
+def upgrade():
+    op.create_table(
+        'show_rollover',
+        sa.Column('id', sa.Boolean(), server_default=sa.true(),
+                  nullable=False),
+        sa.Column('rolled_at', sa.DateTime(), nullable=False),
+        sa.CheckConstraint('id', name='ck_show_rollover_single_row'),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.execute('INSERT INTO show_rollover (rolled_at) VALUES (localtimestamp)')
+    op.create_table(
+        'area',
+        sa.Column('state', sa.String(length=120), nullable=False),
+        sa.Column('city', sa.String(length=120), nullable=False),
+        sa.Column('num_venues', sa.Integer(), server_default='0',
+                  nullable=False),
+        sa.Column('num_upcoming_shows', sa.Integer(), server_default='0',
+                  nullable=False),
+        sa.PrimaryKeyConstraint('state', 'city')
+    )
+    op.execute("""
+        INSERT INTO area (state, city, num_venues, num_upcoming_shows)
+        SELECT v.state, v.city, count(*), coalesce(sum(u.upcoming), 0)
+        FROM venue v
+        CROSS JOIN LATERAL (
+            SELECT count(*) AS upcoming FROM show s
+            WHERE s.venue_id = v.id AND s.start_time >
+                (SELECT rolled_at FROM show_rollover)) u
+        GROUP BY v.state, v.city
+    """)
+    for function in FUNCTIONS:
+        op.execute(function)
+    for table, event, referencing, function in TRIGGERS:
+        op.execute('CREATE TRIGGER %s_area_%s AFTER %s ON %s %s '
+                   'FOR EACH STATEMENT EXECUTE FUNCTION %s()' % (
+                       table, event.lower(), event, table, referencing,
+                       function))
+    # the venues of one area are read by (state, city)
+    op.drop_index('ix_venue_state', table_name='venue')
+    op.create_index('ix_venue_state_city', 'venue', ['state', 'city'],
+                    unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_venue_state_city', table_name='venue')
+    op.create_index('ix_venue_state', 'venue', ['state'], unique=False)
+    for table, event, referencing, function in reversed(TRIGGERS):
+        op.execute('DROP TRIGGER %s_area_%s ON %s' % (
+            table, event.lower(), table))
+    for name in ('rollover_shows', 'area_shows_changed',
+                 'area_venues_changed', 'area_apply_shows', 'area_apply'):
+        op.execute('DROP FUNCTION %s' % name)
+    op.drop_table('area')
+    op.drop_table('show_rollover')
@@ -0,0 +1,26 @@
+"""add show index on start time and id
+
+Revision ID: 9d4e2a7b1c05
+Revises: 3f9a6c1e8b52
+Create Date: 2022-06-24 16:05:48.207163
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9d4e2a7b1c05'
+down_revision = '3f9a6c1e8b52'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # keyset pagination of /shows orders and seeks on (start_time, id)
+    op.create_index('ix_show_start_time_id', 'show', ['start_time', 'id'],
+                    unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_show_start_time_id', table_name='show')
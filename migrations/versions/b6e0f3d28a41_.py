@@ -0,0 +1,31 @@
+"""add updated_at to venue, artist and show
+
+Revision ID: b6e0f3d28a41
+Revises: 9d4e2a7b1c05
+Create Date: 2022-06-28 11:23:05.664470
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b6e0f3d28a41'
+down_revision = '9d4e2a7b1c05'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    for table in ('venue', 'artist', 'show'):
+        op.add_column(table, sa.Column(
+            'updated_at', sa.DateTime(), nullable=False,
+            server_default=sa.text("timezone('utc', now())")))
+        op.create_index(op.f('ix_%s_updated_at' % table), table,
+                        ['updated_at'], unique=False)
+
+
+def downgrade():
+    for table in ('show', 'artist', 'venue'):
+        op.drop_index(op.f('ix_%s_updated_at' % table), table_name=table)
+        op.drop_column(table, 'updated_at')
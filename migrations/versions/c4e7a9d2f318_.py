@@ -0,0 +1,229 @@
+"""add upcoming and past show counters to venue and artist
+
+Revision ID: c4e7a9d2f318
+Revises: 8a3f5c1d7e26
+Create Date: 2022-07-01 14:05:21.770342
+
+"""
+from alembic import context, op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c4e7a9d2f318'
+down_revision = '8a3f5c1d7e26'
+branch_labels = None
+depends_on = None
+
+
+# The show triggers now only update the counters of the venues and
+# artists, the area counts follow the venue counters through the venue
+# trigger. Rows are locked venues first (then their areas), then artists,
+# each in id order, in every writer. Only the show triggers and the
+# rollover take the show_rollover row, never after a venue row, so the
+# rollover cannot deadlock with a venue update
+FUNCTIONS = [
+    """
+    CREATE OR REPLACE FUNCTION area_venues_changed() RETURNS trigger AS $$
+    BEGIN
+        IF TG_OP = 'INSERT' THEN
+            PERFORM area_apply(array_agg(state), array_agg(city),
+                               array_agg(1::bigint),
+                               array_agg(upcoming_shows_count::bigint))
+            FROM new_rows;
+        ELSIF TG_OP = 'DELETE' THEN
+            PERFORM area_apply(array_agg(state), array_agg(city),
+                               array_agg(-1::bigint),
+                               array_agg(-upcoming_shows_count::bigint))
+            FROM old_rows;
+        ELSE
+            -- a venue changing area takes its upcoming shows along
+            PERFORM area_apply(array_agg(d.state), array_agg(d.city),
+                               array_agg(d.venues), array_agg(d.shows))
+            FROM old_rows o
+            JOIN new_rows n ON n.id = o.id
+            CROSS JOIN LATERAL (VALUES
+                (o.state, o.city, -1::bigint,
+                 -o.upcoming_shows_count::bigint),
+                (n.state, n.city, 1::bigint, n.upcoming_shows_count::bigint)
+            ) AS d(state, city, venues, shows)
+            WHERE (o.state, o.city, o.upcoming_shows_count) IS DISTINCT
+                FROM (n.state, n.city, n.upcoming_shows_count);
+        END IF;
+        RETURN NULL;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+    """
+    CREATE FUNCTION apply_show_counts(venue_ids integer[],
+                                      artist_ids integer[],
+                                      upcoming_changes bigint[],
+                                      past_changes bigint[])
+    RETURNS void AS $$
+    BEGIN
+        PERFORM 1 FROM venue WHERE id = ANY(venue_ids)
+        ORDER BY id FOR NO KEY UPDATE;
+        UPDATE venue v SET
+            upcoming_shows_count = v.upcoming_shows_count + d.upcoming,
+            past_shows_count = v.past_shows_count + d.past
+        FROM (
+            SELECT id, sum(upcoming)::integer, sum(past)::integer
+            FROM unnest(venue_ids, upcoming_changes, past_changes)
+                AS s(id, upcoming, past)
+            GROUP BY id
+            HAVING sum(upcoming) <> 0 OR sum(past) <> 0
+        ) AS d(id, upcoming, past)
+        WHERE v.id = d.id;
+        PERFORM 1 FROM artist WHERE id = ANY(artist_ids)
+        ORDER BY id FOR NO KEY UPDATE;
+        UPDATE artist a SET
+            upcoming_shows_count = a.upcoming_shows_count + d.upcoming,
+            past_shows_count = a.past_shows_count + d.past
+        FROM (
+            SELECT id, sum(upcoming)::integer, sum(past)::integer
+            FROM unnest(artist_ids, upcoming_changes, past_changes)
+                AS s(id, upcoming, past)
+            GROUP BY id
+            HAVING sum(upcoming) <> 0 OR sum(past) <> 0
+        ) AS d(id, upcoming, past)
+        WHERE a.id = d.id;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+    """
+    CREATE FUNCTION shows_changed() RETURNS trigger AS $$
+    DECLARE
+        since timestamp;
+    BEGIN
+        SELECT rolled_at INTO since FROM show_rollover FOR SHARE;
+        IF TG_OP = 'INSERT' THEN
+            PERFORM apply_show_counts(
+                array_agg(venue_id), array_agg(artist_id),
+                array_agg((start_time > since)::integer::bigint),
+                array_agg((start_time <= since)::integer::bigint))
+            FROM new_rows;
+        ELSIF TG_OP = 'DELETE' THEN
+            PERFORM apply_show_counts(
+                array_agg(venue_id), array_agg(artist_id),
+                array_agg(-(start_time > since)::integer::bigint),
+                array_agg(-(start_time <= since)::integer::bigint))
+            FROM old_rows;
+        ELSE
+            PERFORM apply_show_counts(
+                array_agg(venue_id), array_agg(artist_id),
+                array_agg(sign * (start_time > since)::integer),
+                array_agg(sign * (start_time <= since)::integer))
+            FROM (
+                SELECT venue_id, artist_id, start_time, -1::bigint
+                FROM old_rows
+                UNION ALL
+                SELECT venue_id, artist_id, start_time, 1::bigint
+                FROM new_rows
+            ) AS d(venue_id, artist_id, start_time, sign);
+        END IF;
+        RETURN NULL;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+    """
+    CREATE OR REPLACE FUNCTION rollover_shows(until timestamp)
+    RETURNS integer AS $$
+    DECLARE
+        since timestamp;
+        passed integer;
+        venue_ids integer[];
+        artist_ids integer[];
+    BEGIN
+        SELECT rolled_at INTO since FROM show_rollover FOR UPDATE;
+        IF until <= since THEN
+            RETURN 0;
+        END IF;
+        SELECT count(*), array_agg(venue_id), array_agg(artist_id)
+        INTO passed, venue_ids, artist_ids
+        FROM show WHERE start_time > since AND start_time <= until;
+        IF passed > 0 THEN
+            PERFORM apply_show_counts(
+                venue_ids, artist_ids,
+                array_fill(-1::bigint, ARRAY[passed]),
+                array_fill(1::bigint, ARRAY[passed]));
+        END IF;
+        UPDATE show_rollover SET rolled_at = until;
+        RETURN passed;
+    END
+    $$ LANGUAGE plpgsql
+    """
+]
+
+TRIGGERS = [
+    ('INSERT', 'REFERENCING NEW TABLE AS new_rows'),
+    ('UPDATE', 'REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows'),
+    ('DELETE', 'REFERENCING OLD TABLE AS old_rows'),
+]
+
+
+def area_revision():
+    # the functions and triggers this revision replaces
+    return context.script.get_revision('8a3f5c1d7e26').module
+
+
+def upgrade():
+    for event, referencing in TRIGGERS:
+        op.execute('DROP TRIGGER show_area_%s ON show' % event.lower())
+    op.execute('DROP FUNCTION area_shows_changed')
+    op.execute('DROP FUNCTION area_apply_shows')
+    for table in ('venue', 'artist'):
+        op.add_column(table, sa.Column(
+            'upcoming_shows_count', sa.Integer(), server_default='0',
+            nullable=False))
+        op.add_column(table, sa.Column(
+            'past_shows_count', sa.Integer(), server_default='0',
+            nullable=False))
+        op.execute("""
+            UPDATE %(table)s t SET
+                upcoming_shows_count = c.upcoming,
+                past_shows_count = c.past
+            FROM (
+                SELECT %(table)s_id AS id,
+                    count(*) FILTER (WHERE start_time > r.rolled_at)
+                        AS upcoming,
+                    count(*) FILTER (WHERE start_time <= r.rolled_at)
+                        AS past
+                FROM show CROSS JOIN show_rollover r
+                GROUP BY %(table)s_id
+            ) AS c
+            WHERE t.id = c.id
+        """ % {'table': table})
+        # room on each page for the counter updates to stay HOT
+        op.execute('ALTER TABLE %s SET (fillfactor = 90)' % table)
+    for function in FUNCTIONS:
+        op.execute(function)
+    for event, referencing in TRIGGERS:
+        op.execute('CREATE TRIGGER show_counters_%s AFTER %s ON show %s '
+                   'FOR EACH STATEMENT EXECUTE FUNCTION shows_changed()' % (
+                       event.lower(), event, referencing))
+
+
+def downgrade():
+    for event, referencing in reversed(TRIGGERS):
+        op.execute('DROP TRIGGER show_counters_%s ON show' % event.lower())
+    op.execute('DROP FUNCTION shows_changed')
+    op.execute('DROP FUNCTION apply_show_counts')
+    area = area_revision()
+    for function in area.FUNCTIONS:
+        if 'area_apply(' in function.split('RETURNS')[0]:
+            continue
+        op.execute(function.replace(
+            'CREATE FUNCTION area_venues_changed',
+            'CREATE OR REPLACE FUNCTION area_venues_changed').replace(
+            'CREATE FUNCTION rollover_shows',
+            'CREATE OR REPLACE FUNCTION rollover_shows'))
+    for table, event, referencing, function in area.TRIGGERS:
+        if table == 'show':
+            op.execute('CREATE TRIGGER %s_area_%s AFTER %s ON %s %s '
+                       'FOR EACH STATEMENT EXECUTE FUNCTION %s()' % (
+                           table, event.lower(), event, table, referencing,
+                           function))
+    for table in ('artist', 'venue'):
+        op.execute('ALTER TABLE %s RESET (fillfactor)' % table)
+        op.drop_column(table, 'past_shows_count')
+        op.drop_column(table, 'upcoming_shows_count')
@@ -0,0 +1,60 @@
+"""add a duration to show and exclude overlapping bookings
+
+Revision ID: d81b6f3c2a95
+Revises: c4e7a9d2f318
+Create Date: 2022-07-02 16:48:10.205613
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd81b6f3c2a95'
+down_revision = 'c4e7a9d2f318'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # for the = operator on integers in a GiST index
+    op.execute('CREATE EXTENSION IF NOT EXISTS btree_gist')
+    op.add_column('show', sa.Column(
+        'duration', sa.Interval(), nullable=False,
+        server_default=sa.text("interval '2 hours'")))
+    # existing shows are cut short where they would run into the next
+    # show of their venue or artist, shows booked in the same slot are
+    # left with an empty duration
+    op.execute("""
+        UPDATE show s SET duration = least(
+            s.duration,
+            coalesce(n.next_venue_show - s.start_time, s.duration),
+            coalesce(n.next_artist_show - s.start_time, s.duration))
+        FROM (
+            SELECT id,
+                lead(start_time) OVER (
+                    PARTITION BY venue_id ORDER BY start_time, id)
+                    AS next_venue_show,
+                lead(start_time) OVER (
+                    PARTITION BY artist_id ORDER BY start_time, id)
+                    AS next_artist_show
+            FROM show
+        ) AS n
+        WHERE n.id = s.id AND (
+            n.next_venue_show < s.start_time + s.duration OR
+            n.next_artist_show < s.start_time + s.duration)
+    """)
+    op.create_check_constraint('ck_show_duration', 'show',
+                               "duration >= interval '0'")
+    for column in ('venue', 'artist'):
+        op.execute('ALTER TABLE show ADD CONSTRAINT ex_show_%s_overlap '
+                   'EXCLUDE USING gist (%s_id WITH =, '
+                   'tsrange(start_time, start_time + duration) WITH &&)' % (
+                       column, column))
+
+
+def downgrade():
+    op.drop_constraint('ex_show_artist_overlap', 'show')
+    op.drop_constraint('ex_show_venue_overlap', 'show')
+    op.drop_constraint('ck_show_duration', 'show')
+    op.drop_column('show', 'duration')
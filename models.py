@@ -1,12 +1,14 @@
-from flask import Flask
-from flask_sqlalchemy import SQLAlchemy
-from flask_migrate import Migrate
-from sqlalchemy.dialects.postgresql import ARRAY
+from sqlalchemy.dialects.postgresql import ARRAY, ExcludeConstraint
+from replicas import RoutingSQLAlchemy
 
 
-app = Flask(__name__)
-db = SQLAlchemy()
-migrate = Migrate(app, db)
+# bound to the application by create_app() in app.py
+db = RoutingSQLAlchemy()
+
+
+def utc_now():
+    # updated_at values, evaluated by postgres in UTC
+    return db.func.timezone('utc', db.func.now())
 
 
 # ----------------------------------------------------------------------------#
@@ -16,6 +18,15 @@ migrate = Migrate(app, db)
 
 class Venue(db.Model):
     __tablename__ = 'venue'
+    __table_args__ = (
+        # trigram index used by the name search
+        db.Index('ix_venue_name_trgm', 'name', postgresql_using='gin',
+                 postgresql_ops={'name': 'gin_trgm_ops'}),
+        # containment (@>) index used by the genre filters
+        db.Index('ix_venue_genres', 'genres', postgresql_using='gin'),
+        # the venues of one area, and the state filter
+        db.Index('ix_venue_state_city', 'state', 'city'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String, nullable=False)
@@ -29,8 +40,17 @@ class Venue(db.Model):
     seeking_description = db.Column(db.String)
     genres = db.Column(ARRAY(db.String(120)), nullable=False, default=[])
     website = db.Column(db.String)
+    # maintained by the triggers on show and by rollover.rollover(),
+    # never written by the app
+    upcoming_shows_count = db.Column(db.Integer, nullable=False,
+                                     server_default='0')
+    past_shows_count = db.Column(db.Integer, nullable=False,
+                                 server_default='0')
+    # bumped on every change, for the ETags
+    updated_at = db.Column(db.DateTime, nullable=False, index=True,
+                           server_default=utc_now(), onupdate=utc_now())
     shows = db.relationship('Show', backref='venue',
-                            lazy='joined', cascade='all, delete')
+                            lazy='select', cascade='all, delete')
 
     def __repr__(self):
         return f'<Venue id: {self.id}, name: {self.name}, city: {self.city},\
@@ -43,6 +63,14 @@ class Venue(db.Model):
 
 class Artist(db.Model):
     __tablename__ = 'artist'
+    __table_args__ = (
+        # trigram index used by the name search
+        db.Index('ix_artist_name_trgm', 'name', postgresql_using='gin',
+                 postgresql_ops={'name': 'gin_trgm_ops'}),
+        # containment (@>) index used by the genre filters
+        db.Index('ix_artist_genres', 'genres', postgresql_using='gin'),
+        db.Index('ix_artist_state', 'state'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String, nullable=False)
@@ -55,8 +83,17 @@ class Artist(db.Model):
     seeking_venue = db.Column(db.Boolean, nullable=False, default=False)
     seeking_description = db.Column(db.String)
     website = db.Column(db.String)
+    # maintained by the triggers on show and by rollover.rollover(),
+    # never written by the app
+    upcoming_shows_count = db.Column(db.Integer, nullable=False,
+                                     server_default='0')
+    past_shows_count = db.Column(db.Integer, nullable=False,
+                                 server_default='0')
+    # bumped on every change, for the ETags
+    updated_at = db.Column(db.DateTime, nullable=False, index=True,
+                           server_default=utc_now(), onupdate=utc_now())
     shows = db.relationship('Show', backref='artist',
-                            lazy='joined', cascade='all, delete')
+                            lazy='select', cascade='all, delete')
 
     def __repr__(self):
         return f'<Artist id: {self.id}, name: {self.name}, city: {self.city},\
@@ -69,6 +106,25 @@ class Artist(db.Model):
 
 class Show(db.Model):
     __tablename__ = 'show'
+    __table_args__ = (
+        # to look up the upcoming/past shows of a venue or an artist
+        db.Index('ix_show_venue_id_start_time', 'venue_id', 'start_time'),
+        db.Index('ix_show_artist_id_start_time', 'artist_id', 'start_time'),
+        # to page through all shows in (start_time, id) order
+        db.Index('ix_show_start_time_id', 'start_time', 'id'),
+        db.CheckConstraint("duration >= interval '0'",
+                           name='ck_show_duration'),
+        # a venue or an artist is never booked twice at the same time,
+        # checked by GiST indexes so concurrent bookings can not race
+        ExcludeConstraint(
+            ('venue_id', '='),
+            (db.text('tsrange(start_time, start_time + duration)'), '&&'),
+            name='ex_show_venue_overlap', using='gist'),
+        ExcludeConstraint(
+            ('artist_id', '='),
+            (db.text('tsrange(start_time, start_time + duration)'), '&&'),
+            name='ex_show_artist_overlap', using='gist'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     venue_id = db.Column(db.Integer, db.ForeignKey(
@@ -76,7 +132,60 @@ class Show(db.Model):
     artist_id = db.Column(db.Integer, db.ForeignKey(
         'artist.id'), nullable=False)
     start_time = db.Column('start_time', db.DateTime, nullable=False)
+    duration = db.Column(db.Interval, nullable=False,
+                         server_default=db.text("interval '2 hours'"))
+    end_time = db.column_property(start_time + duration)
+    # bumped on every change, for the ETags
+    updated_at = db.Column(db.DateTime, nullable=False, index=True,
+                           server_default=utc_now(), onupdate=utc_now())
 
     def __repr__(self):
         return f'<Show venue_id: {self.venue_id}, artist_id: {self.artist_id},\
         start_time: {self.start_time}>'
+
+
+# (field, message) for the constraints a new show can violate
+SHOW_CONSTRAINT_ERRORS = {
+    'show_venue_id_fkey': ('venue_id', 'There is no venue with this ID.'),
+    'show_artist_id_fkey': ('artist_id', 'There is no artist with this ID.'),
+    'ex_show_venue_overlap': (
+        'venue_id', 'The venue is already booked at that time.'),
+    'ex_show_artist_overlap': (
+        'artist_id', 'The artist is already booked at that time.'),
+}
+
+
+def show_constraint_error(error):
+    # the (field, message) of the show constraint an IntegrityError is
+    # about, None for any other error
+    diag = getattr(getattr(error, 'orig', None), 'diag', None)
+    return SHOW_CONSTRAINT_ERRORS.get(getattr(diag, 'constraint_name', None))
+
+
+class Area(db.Model):
+    # number of venues and of upcoming shows per city and state, kept up
+    # to date by the triggers on venue (which follow the venue counters)
+    # on every write, bulk statements included, never written by the app
+    __tablename__ = 'area'
+
+    state = db.Column(db.String(120), primary_key=True)
+    city = db.Column(db.String(120), primary_key=True)
+    num_venues = db.Column(db.Integer, nullable=False, server_default='0')
+    num_upcoming_shows = db.Column(db.Integer, nullable=False,
+                                   server_default='0')
+
+    def __repr__(self):
+        return f'<Area city: {self.city}, state: {self.state},\
+        num_venues: {self.num_venues}>'
+
+
+class ShowRollover(db.Model):
+    # single row, the counters count a show as upcoming when it starts
+    # after rolled_at. Moved forward by rollover.rollover()
+    __tablename__ = 'show_rollover'
+    __table_args__ = (
+        db.CheckConstraint('id', name='ck_show_rollover_single_row'),
+    )
+
+    id = db.Column(db.Boolean, primary_key=True, server_default=db.true())
+    rolled_at = db.Column(db.DateTime, nullable=False)
@@ -0,0 +1,492 @@
+# ----------------------------------------------------------------------------#
+# Imports
+# ----------------------------------------------------------------------------#
+
+import base64
+from datetime import datetime, timedelta
+from models import (
+    db,
+    Venue,
+    Artist,
+    Show,
+    Area,
+    ShowRollover
+)
+
+
+# ----------------------------------------------------------------------------#
+# Helpers.
+# ----------------------------------------------------------------------------#
+
+
+def show_foreign_key(model):
+    # the show column that points at the given venue or artist model
+    return Show.venue_id if model is Venue else Show.artist_id
+
+
+def rolled_at():
+    # the last rollover, the upcoming/past counters change with it
+    return db.session.query(ShowRollover.rolled_at).scalar_subquery()
+
+
+def entity_filters(model, genres=(), state=None):
+    # venues or artists having every given genre, in the given state.
+    # The genres containment is served by the GIN index on genres
+    conditions = []
+    if genres:
+        conditions.append(model.genres.contains(list(genres)))
+    if state:
+        conditions.append(model.state == state)
+    return conditions
+
+
+def group_by_area(rows):
+    # to build the areas structure in one pass, rows must be sorted
+    # by city and state so every area comes out contiguous
+    areas = []
+    for row in rows:
+        if not areas or areas[-1]['city'] != row.city or \
+                areas[-1]['state'] != row.state:
+            areas.append({
+                'city': row.city,
+                'state': row.state,
+                'venues': []
+            })
+        areas[-1]['venues'].append({
+            key: value for key, value in row._mapping.items()
+            if key not in ('city', 'state')
+        })
+    return areas
+
+
+# ----------------------------------------------------------------------------#
+# Home.
+# ----------------------------------------------------------------------------#
+
+
+def home_data(limit=10):
+    # the latest artists and the latest venues grouped by area, areas
+    # come in the order of their most recent venue
+    recent_artists = db.session.query(
+        Artist.id,
+        Artist.name,
+        Artist.city,
+        Artist.state
+    ).order_by(Artist.id.desc()).limit(limit).all()
+    venues = db.session.query(
+        Venue.id,
+        Venue.name,
+        Venue.city,
+        Venue.state
+    ).order_by(Venue.id.desc()).limit(limit).all()
+    first_seen = {}
+    for index, venue in enumerate(venues):
+        first_seen.setdefault((venue.city, venue.state), index)
+    venues.sort(key=lambda venue: first_seen[(venue.city, venue.state)])
+    return {
+        'recent_artists': [dict(row._mapping) for row in recent_artists],
+        'areas': group_by_area(venues)
+    }
+
+
+# ----------------------------------------------------------------------------#
+# Venues.
+# ----------------------------------------------------------------------------#
+
+
+def venue_areas(genres=(), state=None):
+    # every venue, or the ones matching the genre and state filters, with
+    # its number of upcoming shows, grouped by city and state, in a single
+    # round trip
+    rows = db.session.query(
+        Venue.id,
+        Venue.name,
+        Venue.city,
+        Venue.state,
+        Venue.upcoming_shows_count.label('num_upcoming_shows')
+    ).filter(
+        *entity_filters(Venue, genres, state)
+    ).order_by(Venue.city, Venue.state, Venue.id).all()
+    return group_by_area(rows)
+
+
+def area_venues(state, city):
+    # one area from the area table and its venues, read from the
+    # (state, city) index instead of the whole venue table. None when
+    # there is no venue in the area
+    area = db.session.query(
+        Area.city,
+        Area.state,
+        Area.num_venues,
+        Area.num_upcoming_shows
+    ).filter(Area.state == state, Area.city == city).first()
+    if area is None:
+        return None
+    venues = db.session.query(
+        Venue.id,
+        Venue.name,
+        Venue.upcoming_shows_count.label('num_upcoming_shows')
+    ).filter(Venue.state == state, Venue.city == city).order_by(
+        Venue.id).all()
+    return dict(area._mapping, venues=[
+        dict(row._mapping) for row in venues])
+
+
+def detail_shows(model, entity_id, limit=10, past_offset=0, upcoming_offset=0,
+                 lists=('past', 'upcoming'), counts=None):
+    # past (most recent first) and upcoming (soonest first) shows of a venue
+    # or an artist with the id, name and image of the counterpart joined in
+    # SQL. Each list is bounded by limit and the counts are the counters of
+    # the venue or artist, given as (past, upcoming) when the row is already
+    # loaded. The lists are not queried when the offset is past the end or
+    # when they are left out of lists
+    if counts is None:
+        counts = db.session.query(
+            model.past_shows_count,
+            model.upcoming_shows_count
+        ).filter(model.id == entity_id).first() or (0, 0)
+    past_count, upcoming_count = counts
+    past_query, upcoming_query = detail_show_queries(
+        model, entity_id, limit, past_offset, upcoming_offset)
+    past = []
+    if 'past' in lists and past_offset < past_count:
+        past = past_query.all()
+    upcoming = []
+    if 'upcoming' in lists and upcoming_offset < upcoming_count:
+        upcoming = upcoming_query.all()
+    return detail_shows_data(past, upcoming, counts, limit, past_offset,
+                             upcoming_offset)
+
+
+def detail_show_queries(model, entity_id, limit=10, past_offset=0,
+                        upcoming_offset=0):
+    # the (past, upcoming) queries of detail_shows(), independent of each
+    # other so they can also be run concurrently. Shows are split at the
+    # last rollover like the counters, so the lists agree with the counts
+    counterpart = Artist if model is Venue else Venue
+    prefix = counterpart.__tablename__
+    since = rolled_at()
+    shows = db.session.query(
+        Show.start_time,
+        counterpart.id.label(prefix + '_id'),
+        counterpart.name.label(prefix + '_name'),
+        counterpart.image_link.label(prefix + '_image_link')
+    ).join(counterpart, show_foreign_key(counterpart) == counterpart.id
+           ).filter(show_foreign_key(model) == entity_id)
+    return (
+        shows.filter(Show.start_time <= since).order_by(
+            Show.start_time.desc()).limit(limit).offset(past_offset),
+        shows.filter(Show.start_time > since).order_by(
+            Show.start_time).limit(limit).offset(upcoming_offset)
+    )
+
+
+def detail_shows_data(past, upcoming, counts, limit, past_offset,
+                      upcoming_offset):
+    # the lists are cut to the counts, e.g. a show deleted between the
+    # read of the counters and the read of the lists
+    past_count, upcoming_count = counts
+    return {
+        'past_shows': [dict(row._mapping) for row in past
+                       ] if past_offset < past_count else [],
+        'upcoming_shows': [dict(row._mapping) for row in upcoming
+                           ] if upcoming_offset < upcoming_count else [],
+        'past_shows_count': past_count,
+        'upcoming_shows_count': upcoming_count,
+        'past_offset': past_offset,
+        'upcoming_offset': upcoming_offset,
+        'shows_limit': limit
+    }
+
+
+def detail_version(model, entity_id):
+    # what a venue or artist page renders from in one round trip: the row,
+    # its shows with their counterparts, and the last rollover since it
+    # moves shows from upcoming to past. Returns (version, None) or None
+    # when the entity does not exist
+    return version_state(detail_version_query(model, entity_id).first())
+
+
+def detail_version_query(model, entity_id):
+    counterpart = Artist if model is Venue else Venue
+    shows = db.session.query(
+        db.func.max(db.func.greatest(
+            Show.updated_at, counterpart.updated_at)).label('updated_at'),
+        db.func.count().label('count')
+    ).join(counterpart, show_foreign_key(counterpart) == counterpart.id
+           ).filter(show_foreign_key(model) == entity_id).subquery()
+    return db.session.query(
+        model.updated_at,
+        shows.c.updated_at,
+        shows.c.count,
+        rolled_at()
+    ).join(shows, db.true()).filter(model.id == entity_id)
+
+
+def version_state(row):
+    # the (version, last_modified) of a detail_version_query() row. The
+    # pages go without Last-Modified: deleting a show or an artist and
+    # the rollover change them without moving any updated_at, a client
+    # asking If-Modified-Since would get a stale 304. The ETag covers
+    # the counts and the rollover
+    if row is None:
+        return None
+    return tuple(row), None
+
+
+def listing_version(model):
+    # what the venues or artists listing renders from, the venues listing
+    # also depends on the upcoming shows through its counts, which change
+    # on writes and at the rollover. Every part is answered from an index.
+    # Returns (version, None), deletes move no updated_at either (see
+    # version_state)
+    columns = [
+        db.session.query(db.func.max(model.updated_at)).scalar_subquery(),
+        db.session.query(db.func.count(model.id)).scalar_subquery(),
+        rolled_at()
+    ]
+    if model is Venue:
+        columns += [
+            db.session.query(db.func.max(Show.updated_at)).scalar_subquery(),
+            db.session.query(db.func.count()).filter(
+                Show.start_time > rolled_at()).scalar_subquery()
+        ]
+    return tuple(db.session.query(*columns).one()), None
+
+
+# ----------------------------------------------------------------------------#
+# Search.
+# ----------------------------------------------------------------------------#
+
+
+def search(model, search_term, page=1, per_page=20, genres=(), state=None):
+    # one page of venues or artists matching the search term and the
+    # genre and state filters with their number of upcoming shows, the
+    # total number of hits comes from a window function over the same
+    # query. The ILIKE is served by the trigram index on name and hits
+    # are ranked by similarity
+    page = max(page, 1)
+    rows = db.session.query(
+        model.id,
+        model.name,
+        model.upcoming_shows_count.label('num_upcoming_shows'),
+        db.func.count().over().label('total')
+    ).filter(
+        model.name.ilike('%' + search_term + '%'),
+        *entity_filters(model, genres, state)
+    ).order_by(
+        db.func.similarity(model.name, search_term).desc(),
+        model.name,
+        model.id
+    ).limit(
+        per_page).offset((page - 1) * per_page).all()
+    count = rows[0].total if rows else 0
+    return {
+        'count': count,
+        'page': page,
+        'pages': (count + per_page - 1) // per_page,
+        'data': [{
+            'id': row.id,
+            'name': row.name,
+            'num_upcoming_shows': row.num_upcoming_shows
+        } for row in rows]
+    }
+
+
+# ----------------------------------------------------------------------------#
+# Shows.
+# ----------------------------------------------------------------------------#
+
+
+def encode_cursor(start_time, show_id):
+    # opaque keyset cursor for the (start_time, id) ordering of shows
+    value = '%s|%d' % (start_time.isoformat(), show_id)
+    return base64.urlsafe_b64encode(value.encode()).decode()
+
+
+def decode_cursor(cursor):
+    # returns the (start_time, id) tuple, raises ValueError when the
+    # cursor was not produced by encode_cursor()
+    try:
+        start_time, show_id = base64.urlsafe_b64decode(
+            cursor.encode()).decode().split('|')
+        return datetime.fromisoformat(start_time), int(show_id)
+    except (TypeError, ValueError) as error:
+        raise ValueError('invalid cursor') from error
+
+
+def show_columns():
+    # the columns a page of shows can select, by field name
+    return {
+        'id': Show.id,
+        'start_time': Show.start_time,
+        'end_time': Show.end_time,
+        'venue_id': Show.venue_id,
+        'venue_name': Venue.name,
+        'venue_image_link': Venue.image_link,
+        'artist_id': Show.artist_id,
+        'artist_name': Artist.name,
+        'artist_image_link': Artist.image_link
+    }
+
+
+# the fields the /shows listing renders
+SHOW_LISTING_FIELDS = ('id', 'start_time', 'venue_id', 'venue_name',
+                       'artist_id', 'artist_name', 'artist_image_link')
+
+
+def filter_shows(query, joined=(), start=None, end=None, city=None,
+                 state=None, genres=()):
+    # shows starting in the [start, end) window, at a venue in the given
+    # city and state, by an artist having every given genre. The window
+    # is a range scan of the (start_time, id) index, venue and artist are
+    # joined by primary key when a filter or the selected columns (of the
+    # joined classes) need them
+    joined = set(joined)
+    conditions = []
+    if start is not None:
+        conditions.append(Show.start_time >= start)
+    if end is not None:
+        conditions.append(Show.start_time < end)
+    if city:
+        conditions.append(Venue.city == city)
+        joined.add(Venue)
+    if state:
+        conditions.append(Venue.state == state)
+        joined.add(Venue)
+    if genres:
+        conditions.append(Artist.genres.contains(list(genres)))
+        joined.add(Artist)
+    if Venue in joined:
+        query = query.join(Venue, Venue.id == Show.venue_id)
+    if Artist in joined:
+        query = query.join(Artist, Artist.id == Show.artist_id)
+    return query.filter(*conditions)
+
+
+def shows_page(after=None, per_page=30, fields=SHOW_LISTING_FIELDS,
+               **filters):
+    # one page of shows in (start_time, id) order starting after the given
+    # cursor and matching the filter_shows() filters, selecting only the
+    # columns of the given fields and joining venue or artist only when
+    # one of their columns is asked for or filtered on. One extra row is
+    # fetched to know whether there is a next page
+    rows = shows_page_query(after, per_page, fields, **filters).all()
+    return shows_page_data(rows, per_page, fields)
+
+
+def shows_page_query(after=None, per_page=30, fields=SHOW_LISTING_FIELDS,
+                     **filters):
+    columns = show_columns()
+    unknown = set(fields) - set(columns)
+    if unknown:
+        raise ValueError('unknown fields: %s' % ', '.join(sorted(unknown)))
+    # start_time and id are always read for the cursor
+    selected = list(dict.fromkeys(('id', 'start_time') + tuple(fields)))
+    query = filter_shows(db.session.query(
+        *[columns[field].label(field) for field in selected]
+    ).select_from(Show), [columns[field].class_ for field in selected],
+        **filters)
+    if after is not None:
+        query = query.filter(
+            db.tuple_(Show.start_time, Show.id) > db.tuple_(*after))
+    return query.order_by(Show.start_time, Show.id).limit(per_page + 1)
+
+
+def shows_page_data(rows, per_page=30, fields=SHOW_LISTING_FIELDS):
+    next_cursor = None
+    if len(rows) > per_page:
+        rows = rows[:per_page]
+        next_cursor = encode_cursor(rows[-1].start_time, rows[-1].id)
+    return {
+        'data': [{field: row._mapping[field] for field in fields}
+                 for row in rows],
+        'next': next_cursor
+    }
+
+
+def calendar_shows(first_day, last_day, per_day=3, **filters):
+    # the first per_day shows of every day from first_day to last_day
+    # matching the filter_shows() filters, with the venue and artist names.
+    # Each day is its own LIMITed range scan of the start_time index
+    # (LATERAL) so a busy day costs no more than a quiet one. Returns
+    # {date: {'shows': [...], 'more': bool}}
+    days = db.func.generate_series(
+        first_day, last_day, timedelta(days=1)).table_valued(
+        db.column('day', db.DateTime)).render_derived()
+    shows = filter_shows(db.session.query(
+        Show.id,
+        Show.start_time,
+        Show.venue_id,
+        Venue.name.label('venue_name'),
+        Show.artist_id,
+        Artist.name.label('artist_name')
+    ).select_from(Show), (Venue, Artist), start=days.c.day,
+        end=days.c.day + timedelta(days=1), **filters).order_by(
+        Show.start_time, Show.id).limit(per_day + 1).subquery().lateral()
+    rows = db.session.query(days.c.day, shows).select_from(days).join(
+        shows, db.true()).order_by(days.c.day, shows.c.start_time,
+                                   shows.c.id).all()
+    calendar = {}
+    for row in rows:
+        day = calendar.setdefault(row.day.date(), {
+            'shows': [], 'more': False})
+        if len(day['shows']) < per_day:
+            day['shows'].append({
+                key: value for key, value in row._mapping.items()
+                if key != 'day'})
+        else:
+            day['more'] = True
+    return calendar
+
+
+# ----------------------------------------------------------------------------#
+# Venues and artists by field.
+# ----------------------------------------------------------------------------#
+
+
+def entity_columns(model):
+    # the columns of a venue or artist that can be selected by field name,
+    # plus num_upcoming_shows, the name the listings use for the counter
+    columns = {column.key: getattr(model, column.key)
+               for column in model.__table__.columns}
+    columns['num_upcoming_shows'] = model.upcoming_shows_count
+    return columns
+
+
+def select_fields(model, fields):
+    # the id and the requested columns of a venue or artist
+    columns = entity_columns(model)
+    unknown = set(fields) - set(columns)
+    if unknown:
+        raise ValueError('unknown fields: %s' % ', '.join(sorted(unknown)))
+    return db.session.query(model.id.label('id'), *[
+        columns[field].label(field) for field in fields if field != 'id'])
+
+
+def entity_page(model, fields, after=None, per_page=30, genres=(),
+                state=None):
+    # one page of venues or artists in id order after the given id, with
+    # only the requested columns selected
+    query = select_fields(model, fields).filter(
+        *entity_filters(model, genres, state))
+    if after is not None:
+        query = query.filter(model.id > after)
+    rows = query.order_by(model.id).limit(per_page + 1).all()
+    next_id = None
+    if len(rows) > per_page:
+        rows = rows[:per_page]
+        next_id = rows[-1].id
+    return {
+        'data': [{field: row._mapping[field] for field in fields}
+                 for row in rows],
+        'next': next_id
+    }
+
+
+def entity_fields(model, entity_id, fields):
+    # the requested columns of one venue or artist, None when it is missing
+    row = select_fields(model, fields).filter(model.id == entity_id).first()
+    if row is None:
+        return None
+    return {field: row._mapping[field] for field in fields}
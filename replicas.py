@@ -0,0 +1,123 @@
+# ----------------------------------------------------------------------------#
+# Imports
+# ----------------------------------------------------------------------------#
+
+import random
+import time
+from functools import wraps
+from flask import g, has_request_context, session
+from flask_sqlalchemy import SQLAlchemy, SignallingSession
+from sqlalchemy import event, orm
+from sqlalchemy.orm import Session
+
+
+# ----------------------------------------------------------------------------#
+# Routing.
+# ----------------------------------------------------------------------------#
+
+
+def read_replica(view):
+    # marks a view whose reads may be served by a replica
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        g.read_replica = True
+        return view(*args, **kwargs)
+    return wrapper
+
+
+def replicas(app):
+    return app.extensions['replicas']
+
+
+def reads_from_replica(app):
+    # the primary answers everything outside of marked views, and for
+    # REPLICA_STICKY_SECONDS after a write: to the client that made it so
+    # it reads its own writes, and to this process so the pages it caches
+    # are not built from a replica that has not caught up yet
+    if not has_request_context() or not g.get('read_replica'):
+        return False
+    state = replicas(app)
+    if not state['binds']:
+        return False
+    sticky = app.config.get('REPLICA_STICKY_SECONDS', 5)
+    if time.monotonic() < state['last_write'] + sticky:
+        return False
+    return session.get('_primary_until', 0) < time.time()
+
+
+class RoutingSession(SignallingSession):
+    # sends the reads of marked views to one replica per session, flushes
+    # and every other statement go to the primary
+    def __init__(self, db, **options):
+        self.db = db
+        SignallingSession.__init__(self, db, **options)
+
+    def get_bind(self, mapper=None, clause=None, **kwargs):
+        # kwargs of the scoped_session proxy are not used by flask_sqlalchemy
+        if self._flushing or not reads_from_replica(self.app):
+            return SignallingSession.get_bind(self, mapper, clause)
+        if 'replica' not in self.info:
+            self.info['replica'] = random.choice(
+                replicas(self.app)['binds'])
+        return self.db.get_engine(self.app, self.info['replica'])
+
+
+class RoutingSQLAlchemy(SQLAlchemy):
+    # SQLAlchemy with the replicas of SQLALCHEMY_REPLICA_URIS added as
+    # binds, so they get the pool options of the primary engine
+    listening = False
+
+    def init_app(self, app):
+        binds = dict(app.config.get('SQLALCHEMY_BINDS') or {})
+        names = []
+        for index, uri in enumerate(
+                app.config.get('SQLALCHEMY_REPLICA_URIS') or []):
+            names.append('replica_%d' % index)
+            binds[names[-1]] = uri
+        app.config['SQLALCHEMY_BINDS'] = binds
+        app.extensions['replicas'] = {'binds': names, 'last_write': 0}
+        # the session events are global, one set of listeners serves the
+        # sessions of every app
+        if not self.listening:
+            listen_for_writes()
+            self.listening = True
+        SQLAlchemy.init_app(self, app)
+
+    def create_session(self, options):
+        return orm.sessionmaker(class_=RoutingSession, db=self, **options)
+
+
+# ----------------------------------------------------------------------------#
+# Stickiness.
+# ----------------------------------------------------------------------------#
+
+
+def mark_written(app):
+    # starts the sticky window, for writes made outside of the ORM session
+    sticky = app.config.get('REPLICA_STICKY_SECONDS', 5)
+    replicas(app)['last_write'] = time.monotonic()
+    if has_request_context():
+        session['_primary_until'] = time.time() + sticky
+
+
+def listen_for_writes():
+    # a committed flush or bulk statement starts the sticky window of the
+    # app of the session
+    @event.listens_for(Session, 'after_flush')
+    def after_flush(db_session, flush_context):
+        db_session.info['wrote'] = True
+
+    @event.listens_for(Session, 'after_bulk_update')
+    @event.listens_for(Session, 'after_bulk_delete')
+    def after_bulk(context):
+        context.session.info['wrote'] = True
+
+    @event.listens_for(Session, 'after_commit')
+    def after_commit(db_session):
+        if db_session.info.pop('wrote', False) and \
+                isinstance(db_session, RoutingSession):
+            mark_written(db_session.app)
+
+    @event.listens_for(Session, 'after_soft_rollback')
+    def after_soft_rollback(db_session, previous_transaction):
+        db_session.info.pop('wrote', None)
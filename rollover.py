@@ -0,0 +1,99 @@
+# ----------------------------------------------------------------------------#
+# Imports
+# ----------------------------------------------------------------------------#
+
+import threading
+import time
+from datetime import datetime
+import click
+from flask.cli import with_appcontext
+from sqlalchemy.exc import OperationalError
+from models import db
+from cache import cache
+
+
+# ----------------------------------------------------------------------------#
+# Rollover.
+# ----------------------------------------------------------------------------#
+
+
+def rollover(until=None):
+    # moves the shows that started since the last rollover from the
+    # upcoming counters to the past ones. The triggers keep the counters
+    # right on every write, only the passing of time needs this. The
+    # requests run it (init_rollover), cron may as well
+    passed = db.session.execute(
+        db.text('SELECT rollover_shows(:until)'),
+        {'until': until or datetime.now()}).scalar()
+    db.session.commit()
+    if passed:
+        # the statement went around the ORM, nothing was invalidated. The
+        # venue and artist pages split their shows at the rollover. With
+        # the memory backend this only reaches the cache of this process,
+        # the workers catch up on their next check
+        cache.invalidate('shows', 'rollover')
+    return passed
+
+
+@click.command('rollover')
+@with_appcontext
+def rollover_command():
+    """Move the shows that have started to the past in the counters."""
+    click.echo('%d shows rolled over' % rollover())
+
+
+# ----------------------------------------------------------------------------#
+# Read path.
+# ----------------------------------------------------------------------------#
+
+
+def init_rollover(app):
+    # runs the rollover from the requests, at most once every
+    # ROLLOVER_INTERVAL seconds per process, so the shows move to the past
+    # with no cron job or clock process. The first request of a process
+    # checks before any page is cached
+    interval = app.config.get('ROLLOVER_INTERVAL', 60)
+    if not interval:
+        return
+    state = {'checked_at': None, 'seen': None}
+    lock = threading.Lock()
+
+    @app.before_request
+    def lazy_rollover():
+        checked_at = state['checked_at']
+        if checked_at is not None and \
+                time.monotonic() < checked_at + interval:
+            return
+        # one request of the process checks, the others go on
+        if not lock.acquire(blocking=False):
+            return
+        try:
+            state['checked_at'] = time.monotonic()
+            state['seen'] = follow_rollover(state['seen'])
+        finally:
+            lock.release()
+
+
+def follow_rollover(seen):
+    # advances the watermark on a connection of its own to the primary,
+    # outside of the request session and its replica, and returns it.
+    # The cached pages of this process split at an older watermark are
+    # dropped when shows passed since seen, whichever process rolled them
+    # over: the memory backend of a worker never sees the invalidations
+    # of cron or of the other workers
+    try:
+        with db.engine.begin() as connection:
+            # a writer holds the watermark until it commits, the request
+            # does not wait for it, the next check retries
+            connection.exec_driver_sql("SET LOCAL lock_timeout = '100ms'")
+            connection.execute(db.text('SELECT rollover_shows(:until)'),
+                               {'until': datetime.now()})
+            rolled_at, passed = connection.execute(db.text(
+                'SELECT rolled_at, (SELECT count(*) FROM show '
+                'WHERE start_time > :seen AND start_time <= rolled_at) '
+                'FROM show_rollover'), {'seen': seen}).one()
+    except OperationalError:
+        return seen
+    if passed:
+        cache.invalidate('shows', 'rollover')
+    return rolled_at
@@ -0,0 +1,7 @@
+# ----------------------------------------------------------------------------#
+# Production entry point, served by gunicorn with gunicorn.conf.py:
+#   gunicorn -c gunicorn.conf.py wsgi:app
+# The development server stays `python app.py`.
+# ----------------------------------------------------------------------------#
+
+from app import app